@@ -0,0 +1,526 @@
+# -*- coding: utf-8 -*-
+#
+#  FunkyIDE 编辑器热点路径的性能基准
+#
+#  在 X 虚拟显示器（Xvfb）上无人值守地驱动 FunkyIDE，测量：
+#    - 在 1k/10k/50k 行的Python文件中通过 on_key_press_effect 打字的按键延迟
+#    - 完整高亮与增量高亮的耗时
+#    - 在50个打开的标签页之间切换的耗时
+#    - 运行打印 10^5~10^6 行的脚本时，read_pipe 到输出窗口的吞吐量
+#    - 工作目录中有 10^4/10^5 个文件时文件列表的刷新耗时
+#    - Markdown 预览整篇渲染与按块增量渲染的耗时（先确认按块渲染的结果与整篇渲染一致）
+#
+#  用法:
+#      python benchmarks/bench_editor.py --save benchmarks/baseline.json
+#      python benchmarks/bench_editor.py --compare benchmarks/baseline.json --threshold 0.15
+#  没有 DISPLAY 时会自动启动 Xvfb（也可以用 xvfb-run -a 运行）。发现超过阈值的性能退化时以状态码1退出。
+
+import sys
+import os
+import gc
+import json
+import time
+import re
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+REGRESSION_THRESHOLD = 0.15  # 比基准慢超过15%视为退化
+KEY_INTERVAL_MS = 50  # 模拟打字的按键间隔，约每秒20个字符
+WAIT_TIMEOUT = 300  # 等待某个条件成立的最长时间（秒）
+
+# 每组基准的规模；--quick 用较小的规模快速检查
+SIZES = {
+    'full': {'typing_lines': [1000, 10000, 50000], 'keystrokes': 200,
+             'highlight_lines': 10000, 'highlight_edits': 20,
+             'tabs': 50, 'tab_lines': 1000, 'tab_rounds': 5,
+             'output_lines': [100000, 1000000],
+             'file_counts': [10000, 100000],
+             'markdown_sections': 1000, 'markdown_edits': 20},
+    'quick': {'typing_lines': [1000, 10000], 'keystrokes': 50,
+              'highlight_lines': 2000, 'highlight_edits': 5,
+              'tabs': 50, 'tab_lines': 200, 'tab_rounds': 2,
+              'output_lines': [100000],
+              'file_counts': [10000],
+              'markdown_sections': 100, 'markdown_edits': 5},
+}
+
+
+# --- 运行环境 ---
+
+def ensure_display():
+    """没有可用的 DISPLAY 时启动一个 Xvfb，返回它的进程对象（已有显示器时返回None）。"""
+    if os.environ.get('DISPLAY'):
+        return None
+    xvfb = shutil.which('Xvfb')
+    if not xvfb:
+        sys.exit("没有可用的显示器：请安装 Xvfb，或在 xvfb-run -a 下运行本脚本。")
+    read_fd, write_fd = os.pipe()
+    process = subprocess.Popen([xvfb, '-displayfd', str(write_fd), '-screen', '0', '1280x1024x24', '-nolisten', 'tcp'],
+                               pass_fds=(write_fd,), stderr=subprocess.DEVNULL)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        display = f.readline().strip()  # Xvfb 就绪后写入分配到的显示器编号
+    if not display:
+        sys.exit("Xvfb 启动失败。")
+    os.environ['DISPLAY'] = f":{display}"
+    return process
+
+
+def python_source(lines, seed=0):
+    """生成确定的、带有类、函数、字符串、注释和文档字符串的Python代码。"""
+    rng = random.Random(seed)
+    out = []
+    while len(out) < lines:
+        n = len(out)
+        out.append(f"class Widget{n}(object):")
+        out.append(f'    """Widget number {n}, with a docstring."""')
+        out.append("")
+        out.append(f"    def method_{n}(self, value={rng.randint(0, 99)}):")
+        out.append(f"        # 注释 {rng.random():.6f}")
+        out.append(f"        text = 'value: %d' % (value * {rng.randint(1, 9)})")
+        out.append(f"        return [x ** 2 for x in range(value) if x % {rng.randint(2, 7)} == 0], text")
+        out.append("")
+    return "\n".join(out[:lines]) + "\n"
+
+
+def markdown_source(sections):
+    """生成包含按块切分时需要特殊处理的各种结构的Markdown文档：标题下紧接的列表、被空行隔开的列表项和引用、
+    含空行的原始HTML和围栏代码块、惰性续行以及跨块的引用式链接。"""
+    out = []
+    for n in range(sections):
+        out.append(f"## 第 {n} 节\n- 紧接标题的列表 {n}\n    - 子项\n\n- 空行之后的同一个列表\n惰性续行\n")
+        out.append(f"> 引用 {n}\n\n> 同一个引用的第二段\n")
+        out.append(f"<div class=\"note\">\n\n*原始HTML中的文本 {n}*\n\n</div>\n")
+        out.append(f"```python\ndef f_{n}():\n\n\n    return {n}\n```\n")
+        out.append(f"正文段落 {n}，**粗体**、`代码`和[引用式链接][ref{n % 10}]。\n")
+    out.extend(f"[ref{i}]: https://example.com/{i}" for i in range(10))
+    return "\n".join(out) + "\n"
+
+
+class Harness:
+    """为每组基准创建独立的工作目录、Tk根窗口和 FunkyIDE 实例。
+
+    场景写成生成器，由 run() 在 root.mainloop() 中一步步推进：FunkyIDE 的后台线程通过 root.after 把结果交回
+    界面线程，在线程化的Tcl中这要求主线程正处于 mainloop 之中，用 root.update() 轮询时这些调用会失败。
+    """
+
+    def __init__(self):
+        import tkinter as tk
+        import main
+        self.tk, self.main = tk, main
+        self.workdir = tempfile.mkdtemp(prefix="funkyide-bench-")
+        self.storage = os.path.join(self.workdir, "managed_programs")
+        os.makedirs(self.storage)
+        self.root = self.app = None
+
+    def write(self, name, content):
+        with open(os.path.join(self.storage, name), 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    def start(self):
+        """创建根窗口和 FunkyIDE。首帧之后的延迟初始化要在场景中 yield self.ready 等待。"""
+        self.root = self.tk.Tk()
+        self.root.geometry("1000x750")
+        # 会话和高亮缓存也放在临时目录里：既不碰用户的数据，也不让缓存命中影响测量结果
+        self.app = self.main.FunkyIDE(self.root, storage_path=self.storage,
+                                      journal_path=os.path.join(self.workdir, "journal.json"),
+                                      session_path=os.path.join(self.workdir, "session.json"),
+                                      highlight_cache_path=os.path.join(self.workdir, "highlight_cache"))
+        return self.app
+
+    def ready(self):
+        return bool(self.app.highlight_tag_options)
+
+    def highlighted(self, filename=None):
+        """返回一个条件：该文件（默认为当前文件）的高亮已经完成。"""
+        file_data = self.app.open_files[filename or self.app.current_file]
+        return lambda: file_data['highlighter'].dirty is None
+
+    def run(self, scenario, timeout=WAIT_TIMEOUT):
+        """在 mainloop 中运行场景生成器，返回它的返回值；场景中抛出的异常在 mainloop 结束后重新抛出。
+
+        场景 yield 一个无参函数表示等到它返回真值为止（每毫秒检查一次，超过 timeout 秒时在场景中抛出 TimeoutError），
+        yield None 表示先让界面处理完已排队的事件和空闲任务。
+        """
+        outcome = {}
+
+        def resume(send, value):
+            try:
+                condition = send(value)
+            except StopIteration as stop:
+                outcome['result'] = stop.value
+            except BaseException as e:
+                outcome['error'] = e
+            else:
+                deadline = time.perf_counter() + timeout
+                if condition is None:
+                    self.root.after_idle(wait, None, deadline)
+                else:
+                    self.root.after(1, wait, condition, deadline)
+                return
+            self.root.quit()
+
+        def wait(condition, deadline):
+            try:
+                if condition is not None and not condition():
+                    if time.perf_counter() > deadline:
+                        raise TimeoutError("等待超时")
+                    self.root.after(1, wait, condition, deadline)
+                    return
+            except BaseException as e:
+                resume(scenario.throw, e)
+                return
+            resume(scenario.send, None)
+
+        self.root.after(0, resume, scenario.send, None)
+        self.root.mainloop()
+        if 'error' in outcome:
+            raise outcome['error']
+        return outcome.get('result')
+
+    def close(self):
+        if self.root is not None:
+            self.app.run_manager.stop_all(kill=True)
+            self.app.file_watcher.stop()
+            self.app.search_index.close()  # 否则索引线程和进程池会一直留到整个基准结束
+            self.app.symbol_index.close()
+            self.root.destroy()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def ms(seconds):
+    return round(seconds * 1000, 3)
+
+
+# --- 基准 ---
+
+def bench_typing(sizes):
+    """按固定间隔模拟按键，测量每次按键从计划时刻到界面空闲的延迟（包含被高亮等任务耽搁的时间）。"""
+    results = {}
+    for lines in sizes['typing_lines']:
+        h = Harness()
+        try:
+            name = f"typing_{lines}.py"
+            h.write(name, python_source(lines))
+            app = h.start()
+
+            def scenario():
+                yield h.ready
+                app.open_file(name)
+                yield h.highlighted()
+                text = app.text_area
+                text.mark_set("insert", f"{lines // 2}.0")
+                latencies, chars = [], "abcdefghij(),.: "
+                begin = time.perf_counter() + 0.1
+                count = sizes['keystrokes']
+
+                def press(i):
+                    intended = begin + i * KEY_INTERVAL_MS / 1000
+                    char = chars[i % len(chars)]
+                    event = SimpleNamespace(char=char, keysym=char, state=0, widget=text)
+                    if app.on_key_press_effect(event) != 'break':
+                        text.insert("insert", char)  # 特效关闭时由Text类绑定插入字符
+                    app.schedule_syntax_highlight()
+                    h.root.after_idle(lambda: latencies.append(time.perf_counter() - intended))
+                    if i + 1 < count:
+                        delay = begin + (i + 1) * KEY_INTERVAL_MS / 1000 - time.perf_counter()
+                        h.root.after(max(0, int(delay * 1000)), press, i + 1)
+
+                h.root.after(100, press, 0)
+                yield lambda: len(latencies) >= count
+                return {f"typing_{lines}_p50_ms": ms(percentile(latencies, 0.5)),
+                        f"typing_{lines}_p99_ms": ms(percentile(latencies, 0.99))}
+
+            results.update(h.run(scenario()))
+        finally:
+            h.close()
+    return results
+
+
+def bench_highlight(sizes):
+    """完整高亮：打开文件到高亮完成；增量高亮：在随机位置插入一行后重新高亮。"""
+    lines = sizes['highlight_lines']
+    h = Harness()
+    try:
+        name = f"highlight_{lines}.py"
+        h.write(name, python_source(lines, seed=1))
+        app = h.start()
+
+        def scenario():
+            yield h.ready
+            full = []
+            for i in range(3):
+                # 每次用一个空的高亮缓存，否则第二、三次打开直接命中缓存，测到的不是完整高亮
+                app.highlight_cache = h.main.HighlightCache(os.path.join(h.workdir, f"highlight_cache_{i}"))
+                started = time.perf_counter()
+                app.open_file(name)
+                yield h.highlighted()
+                full.append(time.perf_counter() - started)
+                app.close_tab(name)
+                yield None
+            app.open_file(name)
+            yield h.highlighted()
+            rng, incremental = random.Random(2), []
+            for _ in range(sizes['highlight_edits']):
+                app.text_area.insert(f"{rng.randint(1, lines)}.0", "value = compute('x', 42)  # edit\n")
+                started = time.perf_counter()
+                app.apply_syntax_highlighting()
+                yield h.highlighted()
+                incremental.append(time.perf_counter() - started)
+            return {f"highlight_full_{lines}_ms": ms(percentile(full, 0.5)),
+                    f"highlight_incremental_{lines}_p50_ms": ms(percentile(incremental, 0.5)),
+                    f"highlight_incremental_{lines}_p99_ms": ms(percentile(incremental, 0.99))}
+
+        return h.run(scenario())
+    finally:
+        h.close()
+
+
+def bench_tabs(sizes):
+    """依次切换到每个打开的标签页，包括重新布局与绘制的时间。"""
+    h = Harness()
+    try:
+        names = [f"tab_{i:02d}.py" for i in range(sizes['tabs'])]
+        for i, name in enumerate(names):
+            h.write(name, python_source(sizes['tab_lines'], seed=i))
+        app = h.start()
+
+        def scenario():
+            yield h.ready
+            for name in names:
+                app.open_file(name)
+            for name in names:
+                yield h.highlighted(name)
+            switches = []
+            for _ in range(sizes['tab_rounds']):
+                for name in names:
+                    started = time.perf_counter()
+                    app.switch_to_tab(name)
+                    h.root.update_idletasks()
+                    switches.append(time.perf_counter() - started)
+            return {f"tab_switch_{sizes['tabs']}_p50_ms": ms(percentile(switches, 0.5)),
+                    f"tab_switch_{sizes['tabs']}_p99_ms": ms(percentile(switches, 0.99))}
+
+        return h.run(scenario())
+    finally:
+        h.close()
+
+
+def bench_output(sizes):
+    """运行一个大量打印的脚本，测量输出全部显示所需的时间，以及期间界面最长的一次卡顿。
+
+    卡顿用每毫秒一次的心跳测量：两次心跳之间的最长间隔就是界面线程最长的一段无响应时间。
+    """
+    results = {}
+    for count in sizes['output_lines']:
+        h = Harness()
+        try:
+            name = f"print_{count}.py"
+            h.write(name, f"for i in range({count}):\n    print('output line', i, 'x' * 40)\n")
+            app = h.start()
+
+            def scenario():
+                yield h.ready
+                app.open_file(name)
+                finished = []
+                update_output_text = app.update_output_text
+
+                def capture(text_widget, chunks):
+                    update_output_text(text_widget, chunks)
+                    if any("--- 进程结束" in data for _, data in chunks):
+                        finished.append(time.perf_counter())
+
+                app.update_output_text = capture
+                beat = {'last': time.perf_counter(), 'longest': 0.0}
+
+                def heartbeat():
+                    now = time.perf_counter()
+                    beat['longest'] = max(beat['longest'], now - beat['last'])
+                    beat['last'] = now
+                    if not finished:
+                        h.root.after(1, heartbeat)
+
+                started = time.perf_counter()
+                app.run_python_script()
+                beat['last'] = time.perf_counter()
+                h.root.after(1, heartbeat)
+                yield lambda: finished
+                elapsed = finished[0] - started
+                return {f"output_{count}_lines_per_s": round(count / elapsed),
+                        f"output_{count}_max_stall_ms": ms(beat['longest'])}
+
+            results.update(h.run(scenario()))
+        finally:
+            h.close()
+    return results
+
+
+def bench_file_list(sizes):
+    """首次列出工作目录、手动刷新，以及新建一个文件后列表跟上变化的耗时。"""
+    results = {}
+    for count in sizes['file_counts']:
+        h = Harness()
+        try:
+            for i in range(count):
+                open(os.path.join(h.storage, f"file_{i:06d}.py"), 'w').close()
+            started = time.perf_counter()
+            app = h.start()
+
+            def scenario():
+                yield lambda: len(app.file_list.items) == count
+                initial = time.perf_counter() - started
+
+                # 没有变化时手动刷新不会回调界面，所以直接记录后台线程完成这次完整扫描的时刻
+                rescans = []
+                watcher_rescan = app.file_watcher._rescan
+                app.file_watcher._rescan = lambda *args: (watcher_rescan(*args), rescans.append(time.perf_counter()))
+                refresh_started = time.perf_counter()
+                app.update_file_list()
+                yield lambda: rescans
+                refresh = rescans[-1] - refresh_started
+
+                watch_started = time.perf_counter()
+                open(os.path.join(h.storage, "zz_new_file.py"), 'w').close()
+                yield lambda: "zz_new_file.py" in app.file_list.items
+                watch = time.perf_counter() - watch_started
+
+                return {f"file_list_{count}_initial_ms": ms(initial),
+                        f"file_list_{count}_refresh_ms": ms(refresh),
+                        f"file_list_{count}_new_file_ms": ms(watch)}
+
+            results.update(h.run(scenario()))
+        finally:
+            h.close()
+    return results
+
+
+def bench_markdown(sizes):
+    """整篇渲染与编辑一处之后按块增量渲染的耗时。按块渲染的结果与整篇渲染不一致时直接报错，不给出数字。"""
+    import markdown
+    import main
+    sections = sizes['markdown_sections']
+    text = markdown_source(sections)
+    md = markdown.Markdown(extensions=['fenced_code', 'tables'])
+    renderer = main.MarkdownBlockRenderer()
+
+    def normalize(html):
+        return re.sub(r'\n{2,}', '\n', html.strip())  # 块与块之间的空行数不影响显示
+
+    expected = normalize(md.reset().convert(text))
+    actual = normalize('\n'.join(html for _, html in renderer.render(text)))
+    if actual != expected:
+        at = next((i for i, (a, b) in enumerate(zip(actual, expected)) if a != b), min(len(actual), len(expected)))
+        lo = max(0, at - 80)
+        raise AssertionError(f"按块渲染与整篇渲染不一致，第 {at} 个字符附近:\n"
+                             f"按块: {actual[lo:at + 80]!r}\n整篇: {expected[lo:at + 80]!r}")
+
+    full, incremental = [], []
+    rng = random.Random(3)
+    for _ in range(sizes['markdown_edits']):
+        started = time.perf_counter()
+        md.reset().convert(text)
+        full.append(time.perf_counter() - started)
+        n = rng.randrange(sections)
+        text = text.replace(f"正文段落 {n}，", f"正文段落 {n}（已编辑），", 1)
+        started = time.perf_counter()
+        renderer.render(text)
+        incremental.append(time.perf_counter() - started)
+    return {f"markdown_full_{sections}_ms": ms(percentile(full, 0.5)),
+            f"markdown_incremental_{sections}_p50_ms": ms(percentile(incremental, 0.5)),
+            f"markdown_incremental_{sections}_p99_ms": ms(percentile(incremental, 0.99))}
+
+
+BENCHMARKS = {'typing': bench_typing, 'highlight': bench_highlight, 'tabs': bench_tabs,
+              'output': bench_output, 'file_list': bench_file_list, 'markdown': bench_markdown}
+
+
+# --- 结果与比较 ---
+
+def higher_is_better(name):
+    return name.endswith("_per_s")
+
+
+def compare(baseline, current, threshold):
+    """与基准逐项比较，返回退化的指标名列表。"""
+    regressions = []
+    print(f"{'指标':<40}{'基准':>12}{'本次':>12}{'变化':>9}")
+    for name, value in current.items():
+        base = baseline.get(name)
+        if not base or not value:
+            print(f"{name:<40}{'-':>12}{value:>12}")
+            continue
+        # 统一换算成“变慢了多少”：耗时看增加的比例，吞吐量看减少的比例
+        slower = base / value - 1 if higher_is_better(name) else value / base - 1
+        flag = ""
+        if slower > threshold:
+            regressions.append(name)
+            flag = "  ← 退化"
+        print(f"{name:<40}{base:>12}{value:>12}{slower:>+9.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FunkyIDE 编辑器热点路径的性能基准")
+    parser.add_argument("--only", help=f"只运行部分基准，逗号分隔: {','.join(BENCHMARKS)}")
+    parser.add_argument("--quick", action="store_true", help="使用较小的规模")
+    parser.add_argument("--save", metavar="PATH", help="把结果保存为JSON，可作为之后比较的基准")
+    parser.add_argument("--compare", metavar="PATH", help="与之前保存的基准比较")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help=f"变慢超过这个比例即视为退化（默认 {REGRESSION_THRESHOLD}）")
+    args = parser.parse_args()
+
+    names = args.only.split(",") if args.only else list(BENCHMARKS)
+    unknown = [n for n in names if n not in BENCHMARKS]
+    if unknown:
+        parser.error(f"未知的基准: {', '.join(unknown)}")
+    sizes = SIZES['quick' if args.quick else 'full']
+
+    xvfb = ensure_display()
+    try:
+        results = {}
+        for name in names:
+            gc.collect()
+            print(f"运行 {name} ...", file=sys.stderr)
+            results.update(BENCHMARKS[name](sizes))
+    finally:
+        if xvfb:
+            xvfb.terminate()
+
+    import tkinter
+    report = {'meta': {'python': platform.python_version(), 'platform': platform.platform(),
+                       'tk': tkinter.TkVersion, 'cpus': os.cpu_count(),
+                       'size': 'quick' if args.quick else 'full',
+                       'date': time.strftime('%Y-%m-%d %H:%M:%S')},
+              'results': results}
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline['meta'].get('size') != report['meta']['size']:
+            print("警告：基准与本次运行的规模不同，结果不可直接比较。", file=sys.stderr)
+        regressions = compare(baseline['results'], results, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} 项指标退化超过 {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+    else:
+        for name, value in results.items():
+            print(f"{name:<40}{value:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,57 +8,3191 @@
 
 import sys
 import os
+import time
+_STARTUP_T0 = time.perf_counter()  # 用于 --profile-startup 统计模块导入耗时
+import codecs
+import signal
+import bisect
+import select
+import mmap
+import struct
+import re
+try:
+    import re._parser as sre_parse, re._compiler as sre_compile  # 分析词法规则能否跨行
+except ImportError:  # Python 3.10 及更早
+    import sre_parse, sre_compile
+import json
+import hashlib
+import functools
+import abc
+import pickle
+from array import array
+from collections import deque
 import tkinter as tk
-from tkinter import simpledialog, messagebox, Listbox, Scrollbar, END, Frame, Text, Button, Toplevel, Label
-import subprocess
+import tkinter.font as tkfont
+from tkinter import simpledialog, messagebox, Scrollbar, END, Frame, Text, Button, Toplevel, Label
 import threading
-import webbrowser
-import markdown
 
-from pygments import lex
-from pygments.lexers import guess_lexer_for_filename
-from pygments.styles import get_style_by_name
-from pygments.util import ClassNotFound
+from pygments.token import Error, Whitespace, _TokenType
+
+# 以下较慢的模块在第一次用到时才导入，让窗口尽快出现：
+# pygments.lexer/lexers/styles、markdown、http.server、concurrent.futures、subprocess、webbrowser、ctypes、argparse
 
 
 # --- 全局常量与路径设置 ---
 
-def get_base_path():
-    """获取脚本或可执行文件的基础路径，兼容PyInstaller打包。"""
-    if getattr(sys, 'frozen', False):
-        return os.path.dirname(os.path.abspath(sys.executable))
-    else:
-        return os.path.dirname(os.path.abspath(__file__))
+def get_base_path():
+    """获取脚本或可执行文件的基础路径，兼容PyInstaller打包。"""
+    if getattr(sys, 'frozen', False):
+        return os.path.dirname(os.path.abspath(sys.executable))
+    else:
+        return os.path.dirname(os.path.abspath(__file__))
+
+
+BASE_PATH = get_base_path()
+STORAGE_DIR_NAME = "managed_programs"  # 用户代码的存放目录
+STORAGE_PATH = os.path.join(BASE_PATH, STORAGE_DIR_NAME)
+
+# “语言”菜单中可手动指定的词法分析器: (显示名称, Pygments别名)
+LANGUAGE_CHOICES = [
+    ("Python", "python"), ("Markdown", "markdown"), ("JSON", "json"), ("HTML", "html"),
+    ("CSS", "css"), ("JavaScript", "javascript"), ("C", "c"), ("C++", "cpp"), ("Bash", "bash"),
+    ("YAML", "yaml"), ("TOML", "toml"), ("INI", "ini"), ("SQL", "sql"), ("纯文本", "text"),
+]
+HIGHLIGHT_CHUNK_LINES = 500  # 后台高亮结果每批交回UI线程的行数
+HIGHLIGHT_CACHE_PATH = os.path.join(BASE_PATH, ".funkyide_highlight_cache")  # 高亮结果的磁盘缓存目录
+HIGHLIGHT_CACHE_MAX_ENTRIES = 500  # 缓存最多保留的文件数，超出时删去最久没用过的
+HIGHLIGHT_CACHE_VERSION = 2  # 缓存格式或分析逻辑变化时递增，旧缓存自然失效
+
+TAB_BAR_BG = "#3c4043"  # 标签栏背景
+TAB_ACTIVE_BG = "#5f6368"  # 当前标签
+TAB_INACTIVE_BG = "#323639"  # 其余标签
+
+TYPING_EFFECT_MS = 400  # 打字特效的持续时间
+TYPING_EFFECT_TICK_MS = 50  # 淡出调度器的检查间隔
+TYPING_EFFECT_MAX_LINES = 20000  # 超过这个行数的文件不再启用打字特效
+TYPING_EFFECT_PASTE_PAUSE_MS = 500  # 粘贴后暂停打字特效的时间
+
+OUTPUT_FRAME_MS = 33  # 运行窗口刷新输出的间隔（约30帧/秒）
+OUTPUT_SCROLLBACK_LINES = 10000  # 运行窗口最多保留的行数，更早的输出会被裁掉
+OUTPUT_SPILL_TO_FILE = False  # 是否默认把完整输出另存为日志文件
+OUTPUT_LOG_DIR_NAME = ".run_logs"  # 日志文件存放在工作目录下的这个子目录中
+
+MAX_CONCURRENT_RUNS = 2  # 同时运行的脚本数上限，超出的按顺序排队
+
+FILE_POLL_INTERVAL = 1.0  # 不支持 inotify 时，重新扫描工作目录、比较各文件修改时间和大小的间隔（秒）
+FILE_FILTER_DELAY_MS = 100  # 文件列表过滤框停止输入多久后才重新过滤
+
+# inotify 事件掩码，见 <sys/inotify.h>
+IN_CLOSE_WRITE, IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE, IN_DELETE = 0x8, 0x40, 0x80, 0x100, 0x200
+IN_DELETE_SELF, IN_MOVE_SELF, IN_Q_OVERFLOW, IN_IGNORED, IN_ISDIR = 0x400, 0x800, 0x4000, 0x8000, 0x40000000
+
+WARM_POOL_SIZE = 2  # “快速运行”模式下预先启动的解释器进程数
+WARM_PRELOAD_MODULES = []  # 预热进程提前导入的模块，例如 ["numpy", "pandas"]
+
+# 预热进程的启动代码：先导入指定模块，然后等待从stdin读入要运行的脚本路径，在全新的命名空间中执行一次后退出
+_WARM_WORKER_CODE = """
+import sys, os, importlib, runpy, traceback
+for name in sys.argv[1:]:
+    try:
+        importlib.import_module(name)
+    except Exception:
+        pass
+path = sys.stdin.buffer.readline().decode('utf-8').rstrip('\\n')
+if path:
+    usage_fd = os.environ.pop('FUNKYIDE_USAGE_FD', None)
+    if usage_fd is not None:
+        import resource
+        ru = resource.getrusage(resource.RUSAGE_SELF)
+        os.write(int(usage_fd), f"{ru.ru_utime} {ru.ru_stime} {ru.ru_maxrss}".encode())
+        os.close(int(usage_fd))
+    sys.argv = [path]
+    sys.path[0] = os.path.dirname(path)
+    try:
+        runpy.run_path(path, run_name='__main__')
+    except SystemExit:
+        raise
+    except BaseException:
+        etype, value, tb = sys.exc_info()
+        while tb is not None and tb.tb_frame.f_code.co_filename != path:
+            tb = tb.tb_next
+        traceback.print_exception(etype, value, tb)
+        sys.exit(1)
+"""
+
+LIVE_PREVIEW_DELAY_MS = 150  # 停止输入多久后把Markdown的改动推送到实时预览页面
+LIVE_PREVIEW_HOST = "127.0.0.1"  # 实时预览服务器只监听本机，端口由系统分配
+
+# Markdown 预览页面共用的样式表
+PREVIEW_STYLE = """body { font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Helvetica, Arial, sans-serif; line-height: 1.6; max-width: 800px; margin: 20px auto; padding: 0 15px; color: #333;} code { background-color: #f0f0f0; padding: 2px 4px; border-radius: 3px; font-family: "SFMono-Regular", Consolas, "Liberation Mono", Menlo, Courier, monospace;} pre { background-color: #f6f8fa; padding: 16px; border-radius: 5px; overflow-x: auto;} pre code { padding: 0; background-color: transparent; } table { border-collapse: collapse; } th, td { border: 1px solid #ddd; padding: 8px; }"""
+
+SAVE_WRITER_THREADS = 4  # 后台写文件的线程数，退出时批量保存的多个文件会并行写入
+SAVE_FSYNC = "file"  # 保存时的落盘策略："never" 交给系统缓存，"file" 同步文件内容，"full" 连同目录项一起同步
+AUTOSAVE_INTERVAL_MS = 30000  # 把未保存的内容写入恢复日志的间隔
+JOURNAL_PATH = os.path.join(BASE_PATH, ".funkyide_journal.json")  # 恢复日志，程序异常退出后下次启动时据此恢复
+SESSION_PATH = os.path.join(BASE_PATH, ".funkyide_session.json")  # 打开的标签页及其光标、滚动位置，下次启动时恢复
+
+LARGE_FILE_THRESHOLD = 20 * 1024 * 1024  # 超过这个大小的文件以只读的大文件模式打开
+LARGE_FILE_WINDOW_LINES = 2000  # 大文件模式下编辑区中同时载入的行数
+LARGE_FILE_WINDOW_BYTES = 8 * 1024 * 1024  # 每次载入的字节数上限，防止超长的行撑爆编辑区
+LARGE_FILE_INDEX_CHUNK = 64 * 1024  # 行索引的粒度：只记录每块之前的换行符数量
+
+PERF_ENV_VAR = "FUNKYIDE_PERF"  # 设置了这个环境变量时，启动即开启性能监视并显示浮窗
+PERF_SAMPLE_LIMIT = 2000  # 每项指标保留的最近样本数
+PERF_TRACE_LIMIT = 20000  # 保留的最近trace事件数，导出Chrome trace时使用
+PERF_FRAME_MS = 33  # 统计“每帧Tcl调用数”与事件循环延迟的帧间隔
+PERF_HUD_REFRESH_MS = 500  # 浮窗刷新间隔
+
+SEARCH_INDEX_NAME = ".funkyide_search_index"  # 全文搜索的三元组索引文件，保存在工作目录所在的目录中
+SEARCH_DELAY_MS = 150  # 搜索框停止输入多久后开始搜索
+SEARCH_MAX_RESULTS = 1000  # 最多显示的匹配数
+SYMBOL_INDEX_NAME = ".funkyide_symbol_index"  # 符号索引文件，与搜索索引放在一起
+SYMBOL_MAX_RESULTS = 500  # “转到符号”最多显示的结果数
+SYMBOL_KIND_LABELS = {'class': "类", 'function': "函数", 'method': "方法", 'variable': "变量", 'import': "导入"}
+INDEX_POOL_MIN_FILES = 8  # 需要处理的文件少于这个数时直接在当前进程完成，省去进程间通信
+INDEX_SAVE_DELAY = 5.0  # 索引变化后空闲多久才写回磁盘（秒）
+
+EXPORT_PATH = os.path.join(BASE_PATH, "html_export")  # 批量导出HTML的镜像目录
+EXPORT_MANIFEST_NAME = ".export_manifest.json"  # 记录每个源文件的哈希，未修改的文件不会重复导出
+EXPORT_STYLE_NAME = "style.css"  # 所有导出页面共用的样式表
+EXPORT_POOL_MIN_FILES = 4  # 需要导出的文件少于这个数时直接在当前进程渲染，省去启动进程池的开销
+
+# 导出的HTML页面，样式表以相对路径引用
+_EXPORT_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>%s</title><link rel="stylesheet" href="%s"></head>
+<body>
+%s
+</body></html>
+"""
+
+# 实时预览页面：通过 EventSource 接收 [[块哈希, html或null], ...]，null 表示浏览器中已有这个块，直接复用原来的DOM节点
+_LIVE_PREVIEW_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Markdown 预览</title><style>%s</style></head>
+<body><div id="content"></div>
+<script>
+const root = document.getElementById('content');
+const source = new EventSource('/events');
+source.onmessage = (event) => {
+  const update = JSON.parse(event.data);
+  document.title = update.title;
+  const old = new Map();
+  for (const el of root.children) if (!old.has(el.dataset.key)) old.set(el.dataset.key, el);
+  const used = new Set();
+  const children = [];
+  for (const [key, html] of update.blocks) {
+    let el = old.get(key);
+    if (el === undefined) {
+      el = document.createElement('div');
+      el.dataset.key = key;
+      el.innerHTML = html;
+      old.set(key, el);
+    } else if (used.has(el)) {
+      el = el.cloneNode(true);
+    }
+    used.add(el);
+    children.push(el);
+  }
+  root.replaceChildren(...children);
+};
+</script></body></html>
+"""
+
+
+# --- 增量语法高亮 ---
+
+_TAG_NAMES = {}  # {token类型: tag名}，避免对每个token都调用 str()
+_MULTILINE_RULES = {}  # {词法分析器类: _multiline_rules 的结果}
+_NEWLINE_CATEGORIES = {'CATEGORY_SPACE', 'CATEGORY_NOT_DIGIT', 'CATEGORY_NOT_WORD', 'CATEGORY_LINEBREAK'}
+_UNBOUNDED = float('inf')
+
+
+def _tag_name(ttype):
+    name = _TAG_NAMES.get(ttype)
+    if name is None:
+        name = _TAG_NAMES[ttype] = str(ttype)
+    return name
+
+
+class _LineCollector:
+    """把按偏移量产出的token流切分为逐行的 (起始列, 结束列, tag) 段。"""
+
+    def __init__(self, text):
+        self.text = text
+        self.line_start = 0
+        self.next_nl = text.find('\n')
+        self.runs = []
+        self.open = False  # 当前行是否有尚未闭合的跨行匹配开头
+        self.finished = []  # 已经结束、但还没交给调用方的行
+
+    def advance(self, pos):
+        """把当前行推进到 pos 所在的行，途中结束的行都放入 finished。"""
+        while -1 < self.next_nl < pos:
+            self._finish_line()
+
+    def token(self, pos, ttype, value):
+        self.advance(pos)
+        tag = _tag_name(ttype)
+        end = pos + len(value)
+        while -1 < self.next_nl < end:  # token 跨越了换行符
+            if self.next_nl > pos:
+                self._add(pos, self.next_nl, tag)
+            self._finish_line()
+            pos = self.line_start
+        if end > pos:
+            self._add(pos, end, tag)
+
+    def _add(self, start, end, tag):
+        start -= self.line_start
+        end -= self.line_start
+        runs = self.runs
+        if runs and runs[-1][2] == tag and runs[-1][1] == start:
+            runs[-1] = (runs[-1][0], end, tag)  # 合并相邻的同类token
+        else:
+            runs.append((start, end, tag))
+
+    def _finish_line(self):
+        self.finished.append((self.runs, self.open))
+        self.runs = []
+        self.open = False
+        self.line_start = self.next_nl + 1
+        self.next_nl = self.text.find('\n', self.line_start)
+
+    def flush(self, state):
+        """产出所有已结束的行；只有最后一行之后的行首状态是已知的。"""
+        finished, self.finished = self.finished, []
+        for runs, opens in finished[:-1]:
+            yield runs, None, opens
+        if finished:
+            yield finished[-1][0], state, finished[-1][1]
+
+
+def _class_has_newline(items):
+    """正则解析树中的字符集 [...] 能否匹配换行符。"""
+    negate, newline = False, False
+    for op, av in items:
+        name = str(op)
+        if name == 'NEGATE':
+            negate = True
+        elif name == 'LITERAL':
+            newline |= av == 10
+        elif name == 'RANGE':
+            newline |= av[0] <= 10 <= av[1]
+        elif name == 'CATEGORY':
+            newline |= str(av) in _NEWLINE_CATEGORIES
+        else:
+            newline = True
+    return newline != negate
+
+
+def _newline_reach(items, dotall):
+    """一次匹配最多能跨越几个换行符（含前瞻断言看到的），没有上限时为无穷大。"""
+    total = 0
+    for op, av in items:
+        name = str(op)
+        if name == 'LITERAL':
+            reach = av == 10
+        elif name == 'NOT_LITERAL':
+            reach = av != 10
+        elif name == 'ANY':
+            reach = dotall
+        elif name == 'IN':
+            reach = _class_has_newline(av)
+        elif name in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT'):
+            reach = _newline_reach(av[2], dotall)
+            if reach:
+                reach = _UNBOUNDED if av[1] == sre_parse.MAXREPEAT else reach * av[1]
+        elif name == 'SUBPATTERN':
+            reach = _newline_reach(av[-1], (dotall or av[1] & re.DOTALL) and not av[2] & re.DOTALL)
+        elif name == 'BRANCH':
+            reach = max(_newline_reach(branch, dotall) for branch in av[1])
+        elif name in ('ASSERT', 'ASSERT_NOT'):
+            reach = _newline_reach(av[1], dotall)
+        elif name == 'ATOMIC_GROUP':
+            reach = _newline_reach(av, dotall)
+        elif name == 'GROUPREF_EXISTS':
+            reach = max(_newline_reach(av[1], dotall), _newline_reach(av[2] or [], dotall))
+        elif name == 'GROUPREF':
+            reach = _UNBOUNDED  # 反向引用的内容不确定，按最坏情况处理
+        else:
+            reach = 0  # 锚点等不消耗字符
+        total += reach
+    return total
+
+
+def _any_prefix(state, items):
+    """构造匹配 items 所能匹配的字符串的任意前缀的解析树。断言一律去掉，只会多判定、不会漏判。"""
+    if not items: return []
+    (op, av), rest = items[0], items[1:]
+    sub = functools.partial(sre_parse.SubPattern, state)
+    name = str(op)
+    if name in ('LITERAL', 'NOT_LITERAL', 'ANY', 'IN'):
+        head = [(sre_parse.MAX_REPEAT, (0, 1, sub([(op, av)])))]
+    elif name in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT'):
+        hi = av[1] if av[1] == sre_parse.MAXREPEAT else av[1] - 1
+        head = [(sre_parse.MAX_REPEAT, (0, hi, sub(_whole(state, av[2]))))] + _any_prefix(state, av[2]) if av[1] else []
+    elif name == 'SUBPATTERN':
+        inner = _any_prefix(state, av[-1])
+        head = [(op, (None, av[1], av[2], sub(inner)))] if av[1] or av[2] else inner
+    elif name == 'BRANCH':
+        head = [(op, (None, [sub(_any_prefix(state, branch)) for branch in av[1]]))]
+    elif name == 'ATOMIC_GROUP':
+        head = _any_prefix(state, av)
+    elif name == 'GROUPREF_EXISTS':
+        head = [(sre_parse.BRANCH, (None, [sub(_any_prefix(state, av[1])), sub(_any_prefix(state, av[2] or []))]))]
+    elif name == 'GROUPREF':
+        # 被引用的组可能是任意内容，这里按任意字符处理
+        anything = sub([(sre_parse.MAX_REPEAT, (0, sre_parse.MAXREPEAT, sub([(sre_parse.ANY, None)])))])
+        return [(sre_parse.SUBPATTERN, (None, re.DOTALL, 0, anything))]
+    else:
+        head = []  # 锚点、断言：停在它之前，不消耗字符
+    return [(sre_parse.BRANCH, (None, [sub(head), sub(_whole(state, [(op, av)]) + _any_prefix(state, rest))]))]
+
+
+def _whole(state, items):
+    """去掉断言和向后看的锚点（$、\\b 等）后的 items：截断的文本末尾会让它们误判为不匹配。"""
+    sub = functools.partial(sre_parse.SubPattern, state)
+    result = []
+    for op, av in items:
+        name = str(op)
+        if name in ('ASSERT', 'ASSERT_NOT') or name == 'AT' and str(av) not in ('AT_BEGINNING', 'AT_BEGINNING_STRING'):
+            continue
+        if name in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT'):
+            op, av = sre_parse.MAX_REPEAT, (av[0], av[1], sub(_whole(state, av[2])))
+        elif name == 'SUBPATTERN':
+            av = (av[0], av[1], av[2], sub(_whole(state, av[-1])))
+        elif name == 'BRANCH':
+            av = (None, [sub(_whole(state, branch)) for branch in av[1]])
+        elif name == 'ATOMIC_GROUP':
+            op, av = sre_parse.SUBPATTERN, (None, 0, 0, sub(_whole(state, av)))
+        elif name == 'GROUPREF_EXISTS':
+            op, av = sre_parse.BRANCH, (None, [sub(_whole(state, av[1])), sub(_whole(state, av[2] or []))])
+        result.append((op, av))
+    return result
+
+
+def _leading(items, flags):
+    """规则开头的锚点是否要求从行首开始，以及每次匹配都以之开头的字面量（到第一个换行符为止）。"""
+    items, anchored, lead = list(items), False, ''
+    while items:
+        op, av = items.pop(0)
+        name = str(op)
+        if name == 'AT' and not lead and str(av) in ('AT_BEGINNING', 'AT_BEGINNING_STRING'):
+            anchored = True
+        elif name == 'SUBPATTERN' and not (av[1] or av[2]):
+            items[:0] = av[-1]
+        elif name == 'LITERAL' and not flags & re.IGNORECASE:
+            lead += chr(av)
+            if av == 10: break
+        else:
+            break
+    return anchored, lead
+
+
+def _multiline_rules(lexer):
+    """分析 RegexLexer 的规则能否跨行匹配，返回 (回看行数, {状态名: [(规则序号, 是否从行首开始, 固定的开头, 匹配其任意前缀的fullmatch方法)]})。
+
+    能跨越任意多行的规则（如围栏代码块、块注释、三引号字符串）在某处没匹配上，可能只是因为闭合的部分还没写出来，
+    之后任何位置的编辑都可能让它匹配成功。lex_lines 在这样的规则失败时检查从尝试位置到行尾的内容是否仍是它的开头，
+    是则标出这一行。最多跨越 n 行的规则使一行的结果取决于其后 n 行的内容，重新分析时要多往回退 n 行。
+    """
+    cls = type(lexer)
+    rules = _MULTILINE_RULES.get(cls)
+    if rules is not None: return rules
+    lookahead, openers, prefixes = 0, {}, {}
+    for state, statetokens in getattr(lexer, '_tokens', {}).items():
+        for index, (rexmatch, _, _) in enumerate(statetokens):
+            pattern = getattr(rexmatch, '__self__', None)
+            if not isinstance(pattern, re.Pattern) or not isinstance(pattern.pattern, str): continue
+            if pattern not in prefixes:  # 同一条规则常被 include 到多个状态里
+                parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+                reach = _newline_reach(parsed, bool(pattern.flags & re.DOTALL))
+                if reach == _UNBOUNDED:
+                    prefix = sre_parse.SubPattern(parsed.state, _any_prefix(parsed.state, list(parsed)))
+                    prefixes[pattern] = _leading(parsed, pattern.flags) + (sre_compile.compile(prefix, pattern.flags).fullmatch,)
+                else:
+                    prefixes[pattern] = None
+                    lookahead = max(lookahead, reach)
+            if prefixes[pattern] is not None:
+                openers.setdefault(state, []).append((index,) + prefixes[pattern])
+    rules = _MULTILINE_RULES[cls] = (int(lookahead), openers)
+    return rules
+
+
+def lex_lines(lexer, text, stack=('root',)):
+    """从给定的状态栈开始逐行分析 text，产出 (该行的token段, 下一行行首的状态栈, 该行是否有未闭合的跨行匹配开头)。
+
+    行首落在某个跨行匹配内部时，状态为 None，表示那一行不能作为重新分析的检查点。
+    非 RegexLexer 的词法分析器无法中途恢复状态，所有状态都为 None。
+    未闭合的开头见 _multiline_rules：其后任何一处编辑都可能让它匹配成功，要从它之前重新分析。
+    """
+    from pygments.lexer import RegexLexer
+    text += '\n'  # 与 Pygments 的 ensurenl 行为一致
+    collector = _LineCollector(text)
+
+    if type(lexer).get_tokens_unprocessed is not RegexLexer.get_tokens_unprocessed:
+        for pos, ttype, value in lexer.get_tokens_unprocessed(text):
+            collector.token(pos, ttype, value)
+            yield from collector.flush(None)
+        collector.advance(len(text))
+        yield from collector.flush(None)
+        return
+
+    # 以下与 RegexLexer.get_tokens_unprocessed 的逻辑一致，只是额外记录了每个行首的状态栈
+    pos = 0
+    tokendefs = lexer._tokens
+    openers = _multiline_rules(lexer)[1]
+    statestack = list(stack)
+    statetokens = tokendefs[statestack[-1]]
+    stateopeners = openers.get(statestack[-1])
+    while True:
+        for index, (rexmatch, action, new_state) in enumerate(statetokens):
+            m = rexmatch(text, pos)
+            if m:
+                if stateopeners and not collector.open:
+                    collector.open = _unclosed(stateopeners, index, text, pos, collector)
+                if action is not None:
+                    if type(action) is _TokenType:
+                        collector.token(pos, action, m.group())
+                    else:
+                        end = pos
+                        for tpos, ttype, value in action(lexer, m):
+                            # 有的回调（如 Markdown 带语言的代码块）给出的是相对于子串的位置，按顺序接在上一个token之后
+                            tpos = max(tpos, end)
+                            collector.token(tpos, ttype, value)
+                            end = tpos + len(value)
+                pos = m.end()
+                if new_state is not None:
+                    if isinstance(new_state, tuple):
+                        for state in new_state:
+                            if state == '#pop':
+                                if len(statestack) > 1:
+                                    statestack.pop()
+                            elif state == '#push':
+                                statestack.append(statestack[-1])
+                            else:
+                                statestack.append(state)
+                    elif isinstance(new_state, int):
+                        if abs(new_state) >= len(statestack):
+                            del statestack[1:]
+                        else:
+                            del statestack[new_state:]
+                    elif new_state == '#push':
+                        statestack.append(statestack[-1])
+                    statetokens = tokendefs[statestack[-1]]
+                    stateopeners = openers.get(statestack[-1])
+                break
+        else:
+            if pos >= len(text):
+                break
+            if stateopeners and not collector.open:
+                collector.open = _unclosed(stateopeners, len(statetokens), text, pos, collector)
+            if text[pos] == '\n':
+                # 行尾无法匹配时，状态重置为 root
+                statestack = ['root']
+                statetokens = tokendefs['root']
+                stateopeners = openers.get('root')
+                collector.token(pos, Whitespace, '\n')
+            else:
+                collector.token(pos, Error, text[pos])
+            pos += 1
+        collector.advance(pos)
+        if collector.finished:
+            yield from collector.flush(tuple(statestack) if pos == collector.line_start else None)
+    yield from collector.flush(None)
+
+
+def _unclosed(openers, tried, text, pos, collector):
+    """在 pos 处没匹配上的前 tried 条规则中，是否有跨行规则能把 pos 到行尾（含换行符）的内容当作开头。"""
+    for index, anchored, lead, prefix in openers:
+        if index >= tried: return False
+        if anchored and pos != collector.line_start or lead and not text.startswith(lead, pos): continue
+        if prefix(text, pos, collector.next_nl + 1): return True
+    return False
+
+
+def _group_ranges(first, lines, tags):
+    """把从第 first 行(0 起始)开始的逐行token段，按tag汇总成 tag_add 所需的绝对索引列表。"""
+    ranges = {}
+    for line, runs in enumerate(lines, first + 1):
+        for start_col, end_col, tag in runs:
+            if tag in tags:
+                indices = ranges.get(tag)
+                if indices is None:
+                    indices = ranges[tag] = []
+                indices.append(f"{line}.{start_col}")
+                indices.append(f"{line}.{end_col}")
+    return ranges
+
+
+class IncrementalHighlighter:
+    """为一个Text组件维护逐行的词法状态检查点，编辑后只重新分析受影响的区域。
+
+    通过改写组件的Tcl命令拦截 insert/delete/replace，从而精确记录被编辑的行范围。
+    拦截用的是一个Tcl过程：所有子命令原样转交给组件本来的命令，出错时错误照常交给调用方
+    （Tk 自带的复制、剪切等绑定依赖 catch 这些错误），只有编辑前后的记录才回调Python。
+    词法分析在后台线程中进行，每次编辑都会让 generation 加一，过期的分析结果会被丢弃。
+    """
+
+    def __init__(self, text_widget, tags):
+        self.text = text_widget
+        self.tags = frozenset(tags)  # 已配置样式的tag，其余token类型不需要打tag
+        self.lexer = None
+        self.states = [('root',)]  # 每行行首的状态栈，None 表示该行不能作为检查点
+        self.runs = [[]]  # 每行的 (起始列, 结束列, tag) 列表
+        self.opens = [False]  # 每行是否有未闭合的跨行匹配开头（见 lex_lines），其后的编辑要从它之前重新分析
+        self.lines = []  # 缓冲区内容的逐行副本，编辑时只取回被改动的行，分析时不必再从组件复制整个缓冲区
+        self.dirty = None  # 需要重新分析的 (首行, 末行)，0 起始
+        self._stale_tags = set()  # 编辑时被合并掉的行上可能残留的tag
+        self.generation = 0  # 缓冲区或检查点每变化一次就加一
+        self.version = 0  # 缓冲区内容每变化一次就加一
+        self.on_done = None  # 一次高亮全部完成后在UI线程中调用
+
+        w = text_widget._w
+        self._orig, self._before, self._after = w + "_orig", w + "_before_edit", w + "_after_edit"
+        self._pending = None  # 编辑前记录的 (涉及的行, 总行数)
+        tk_ = text_widget.tk
+        tk_.call("rename", w, self._orig)
+        tk_.createcommand(self._before, self._before_edit)
+        tk_.createcommand(self._after, self._after_edit)
+        tk_.call("proc", w, "args", f"""
+            switch -exact -- [lindex $args 0] {{
+                insert - delete - replace {{
+                    set recorded [{self._before} {{*}}$args]
+                    set result [{self._orig} {{*}}$args]
+                    if {{$recorded}} {{ {self._after} }}
+                    return $result
+                }}
+                default {{ return [{self._orig} {{*}}$args] }}
+            }}""")
+        self.reset()
+
+    def close(self):
+        """恢复组件原本的Tcl命令，必须在销毁组件之前调用。"""
+        tk_ = self.text.tk
+        tk_.call("rename", self.text._w, "")
+        tk_.deletecommand(self._before)
+        tk_.deletecommand(self._after)
+        tk_.call("rename", self._orig, self.text._w)
+
+    def set_lexer(self, lexer):
+        """更换词法分析器，所有检查点随之失效。"""
+        self.lexer = lexer
+        self.reset()
+
+    def reset(self):
+        """丢弃所有检查点，下一次高亮将分析整个缓冲区。"""
+        count = self._line_count()
+        self.lines = self.text.tk.call(self._orig, "get", "1.0", "end-1c").split('\n')
+        self.states = [('root',)] + [None] * (count - 1)
+        self.runs = [[] for _ in range(count)]
+        self.opens = [False] * count
+        self.dirty = (0, count - 1)
+        self._stale_tags = set(self.tags)
+        self.generation += 1
+
+    def load(self, states, runs, opens):
+        """直接采用之前对同样内容的分析结果（见 HighlightCache），不再运行词法分析。行数不符时返回False。"""
+        if len(runs) != self._line_count() or not len(states) == len(opens) == len(runs): return False
+        self.states, self.runs, self.opens = list(states), list(runs), list(opens)
+        self.generation += 1
+        for tag in self._stale_tags & self.tags:
+            self.text.tag_remove(tag, "1.0", END)
+        for tag, indices in _group_ranges(0, self.runs, self.tags).items():
+            self.text.tag_add(tag, *indices)
+        self.dirty = None
+        self._stale_tags = set()
+        return True
+
+    def snapshot(self):
+        """当前的 (行首状态, 逐行token段, 逐行的未闭合标记)；还有未分析的行时返回None。逐行的列表只会被整体替换，浅拷贝即可。"""
+        if self.dirty is not None: return None
+        return list(self.states), list(self.runs), list(self.opens)
+
+    def _line_count(self):
+        return int(self.text.tk.call(self._orig, "index", "end-1c").split('.')[0])
+
+    def _line_of(self, index):
+        return int(self.text.tk.call(self._orig, "index", index).split('.')[0])
+
+    def _before_edit(self, operation, *args):
+        """编辑之前：记下涉及的行和总行数。索引无效时不做记录，编辑命令本身会把错误报告给调用方。"""
+        self._pending = None
+        if not args: return 0
+        indices = args[:1] if operation == 'insert' else args[:2] if operation == 'replace' else args
+        try:
+            lines = [self._line_of(index) for index in indices]
+            self._pending = (lines, self._line_count())
+        except tk.TclError:
+            return 0
+        return 1
+
+    def _after_edit(self):
+        lines, before = self._pending
+        self._pending = None
+        try:
+            delta = self._line_count() - before
+        except tk.TclError:
+            return  # 组件正在销毁
+        # 插入到 "end" 时，Tk 实际插入在最后一个换行符之前
+        first, last = min(min(lines), before) - 1, min(max(lines), before) - 1
+        self.lines[first:last + 1] = self.text.tk.call(
+            self._orig, "get", f"{first + 1}.0", f"{last + delta + 1}.0 lineend").split('\n')
+        self._splice(first, last, delta)
+
+    def _splice(self, first, last, delta):
+        """同步行级缓存：原来的 first..last 行变成了 first..last+delta 行。"""
+        added = last + delta - first
+        # first 行的行首状态只取决于它之前的内容，因此保持不变
+        self.states[first + 1:last + 1] = [None] * added
+        for runs in self.runs[first:last + 1]:
+            self._stale_tags.update(tag for _, _, tag in runs)
+        self.runs[first:last + 1] = [[] for _ in range(added + 1)]
+        self.opens[first:last + 1] = [False] * (added + 1)
+        self.generation += 1
+        self.version += 1
+
+        new_last = last + delta
+        if self.dirty is None:
+            self.dirty = (first, new_last)
+            return
+        lo, hi = self.dirty
+        if hi > last:
+            hi += delta  # 编辑区之后的脏行随之平移
+        elif hi >= first:
+            hi = new_last
+        self.dirty = (min(lo, first), max(hi, new_last))
+
+    def highlight(self):
+        """从脏区之前最近的检查点开始，在后台线程中重新分析，结果分批交回UI线程。"""
+        if self.dirty is None or self.lexer is None:
+            return
+        lo, hi = self.dirty
+        # 最多跨越 n 行的规则：前 n 行的匹配结果可能取决于脏区的内容
+        start = max(lo - _multiline_rules(self.lexer)[0], 0)
+        try:
+            start = self.opens.index(True, 0, start)  # 更早的未闭合开头可能因这次编辑而闭合
+        except ValueError:
+            pass
+        while self.states[start] is None:
+            start -= 1
+
+        self.generation += 1  # 让仍在进行中的旧任务尽快退出
+        # 只复制行列表（指针），拼接文本在后台线程中进行；词法分析通常几行之后就收敛，用不到后面的内容
+        job = (self.generation, self.lexer, start, hi, self.lines[start:], self.states[start:])
+        threading.Thread(target=self._lex_worker, args=job, daemon=True).start()
+
+    def _lex_worker(self, generation, lexer, start, hi, lines, old_states):
+        """后台线程：分析到状态与旧检查点重新吻合为止，每 HIGHLIGHT_CHUNK_LINES 行投递一批结果。"""
+        text = '\n'.join(lines)
+        chunk = []
+        chunk_start = line = start
+        end = start + len(old_states)
+        started = time.perf_counter()
+        try:
+            for runs, next_state, opens in lex_lines(lexer, text, old_states[0]):
+                if generation != self.generation:
+                    return  # 缓冲区已被再次编辑，放弃这次结果
+                chunk.append((runs, next_state, opens))
+                line += 1
+                if line >= end:
+                    break
+                if line > hi and next_state is not None and next_state == old_states[line - start]:
+                    break  # 之后的token流与上次完全相同，无需继续
+                if len(chunk) >= HIGHLIGHT_CHUNK_LINES:
+                    self._post_chunk(generation, chunk_start, chunk, False)
+                    chunk_start, chunk = line, []
+            self._post_chunk(generation, chunk_start, chunk, True)
+            perf_monitor.record("lex", started, time.perf_counter(), {'lines': line - start})
+        except (RuntimeError, tk.TclError):
+            pass  # 主窗口已经关闭
+
+    def _post_chunk(self, generation, first, chunk, done):
+        ranges = _group_ranges(first, [runs for runs, _, _ in chunk], self.tags)
+        self.text.after_idle(self._apply_chunk, generation, first, chunk, ranges, done)
+
+    def _apply_chunk(self, generation, first, chunk, ranges, done):
+        """UI线程：把一批分析结果写回行级缓存，并重新给这些行打tag。
+
+        同一种tag的所有区间合并成一次 tag_add，每次Tcl调用的开销只与tag种类数有关，而与token数无关。
+        """
+        if generation != self.generation:
+            return  # 结果已过期
+        started = time.perf_counter()
+        end = first + len(chunk)
+        stale = set(self._stale_tags)
+        for line, (runs, next_state, opens) in enumerate(chunk, first):
+            stale.update(tag for _, _, tag in self.runs[line])
+            self.runs[line] = runs
+            self.opens[line] = opens
+            if line + 1 < len(self.states):
+                self.states[line + 1] = next_state
+
+        span_start, span_end = f"{first + 1}.0", f"{end + 1}.0"
+        for tag in stale & self.tags:
+            self.text.tag_remove(tag, span_start, span_end)
+        for tag, indices in ranges.items():
+            self.text.tag_add(tag, *indices)
+        if perf_monitor.enabled:
+            perf_monitor.record("apply_tags", started, time.perf_counter(),
+                                {'lines': len(chunk), 'tokens': sum(len(runs) for runs, _, _ in chunk),
+                                 'tag_calls': len(stale & self.tags) + len(ranges)})
+
+        if done:
+            self.dirty = None
+            self._stale_tags = set()
+            if self.on_done: self.on_done()
+        else:
+            # 第 end 行的行首状态已更新而token段尚未更新，被取消时下一轮不能在它之前收敛
+            lo, hi = self.dirty
+            self.dirty = (lo, max(hi, end))
+
+
+class HighlightCache:
+    """高亮结果的磁盘缓存：按“内容哈希 + 词法分析器名”保存逐行token段、行首状态和未闭合标记。
+
+    未修改过的文件再次打开时直接打tag，不必再运行Pygments。每个条目一个文件，写入在后台线程中进行，
+    条目超过上限时删去最久没用过的。
+    """
+
+    def __init__(self, path=HIGHLIGHT_CACHE_PATH, max_entries=HIGHLIGHT_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()  # 写入和清理串行进行
+
+    @staticmethod
+    def key(content, lexer):
+        digest = hashlib.blake2b(content.encode('utf-8', errors='surrogatepass'), digest_size=16)
+        digest.update(f"\0{lexer.name}\0{HIGHLIGHT_CACHE_VERSION}".encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """返回 (行首状态, 逐行token段, 逐行的未闭合标记)，没有缓存时返回None。"""
+        path = os.path.join(self.path, key)
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+            os.utime(path)  # 记录最近使用的时间，清理时据此保留常用的条目
+            return entry
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ValueError):
+            return None
+
+    def put(self, key, states, runs, opens):
+        threading.Thread(target=self._write, args=(key, states, runs, opens), daemon=True).start()
+
+    def _write(self, key, states, runs, opens):
+        with self._lock:
+            try:
+                os.makedirs(self.path, exist_ok=True)
+                _atomic_write(os.path.join(self.path, key), pickle.dumps((states, runs, opens), pickle.HIGHEST_PROTOCOL))
+                self._prune()
+            except OSError:
+                pass  # 缓存只是优化，写不进去也不影响使用
+
+    def _prune(self):
+        with os.scandir(self.path) as entries:
+            entries = [(entry.stat().st_mtime, entry.path) for entry in entries if entry.is_file()]
+        if len(entries) <= self.max_entries: return
+        entries.sort()
+        for _, path in entries[:len(entries) - self.max_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+# --- 打字特效 ---
+
+class TypingFadeEngine:
+    """打字特效的统一淡出调度器。
+
+    每个高亮字符用一个Tk mark记录位置（插入文本后仍然准确），与到期时间一起放入队列；
+    一个周期任务在每次检查时用一次 tag_remove 批量移除所有到期的特效，队列为空时自动停止。
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.queue = deque()  # (Text组件, mark名, 到期时间)，按到期时间排列
+        self._job = None
+        self._counter = 0
+        self._paused_until = 0.0
+
+    def pause(self, ms):
+        """在接下来的 ms 毫秒内停用特效（例如粘贴期间）。"""
+        self._paused_until = time.monotonic() + ms / 1000
+
+    def is_paused(self):
+        return time.monotonic() < self._paused_until
+
+    def add(self, text_widget, index):
+        """登记位于 index 的字符，TYPING_EFFECT_MS 毫秒后移除它的特效。"""
+        self._counter += 1
+        mark = f"typing_fx{self._counter}"
+        text_widget.mark_set(mark, index)  # 默认右重力：在该位置插入的文本会排在mark之前
+        self.queue.append((text_widget, mark, time.monotonic() + TYPING_EFFECT_MS / 1000))
+        if self._job is None:
+            self._job = self.root.after(TYPING_EFFECT_TICK_MS, self._tick)
+
+    def _tick(self):
+        now = time.monotonic()
+        expired = {}  # {Text组件: [mark名, ...]}
+        while self.queue and self.queue[0][2] <= now:
+            text_widget, mark, _ = self.queue.popleft()
+            expired.setdefault(text_widget, []).append(mark)
+
+        for text_widget, marks in expired.items():
+            indices = []
+            for mark in marks:
+                indices += (mark, f"{mark}+1c")
+            try:
+                # Text.tag_remove 只接受一个区间，这里直接调用支持多区间的Tcl命令
+                text_widget.tk.call((text_widget._w, "tag", "remove", "typing_effect") + tuple(indices))
+                text_widget.mark_unset(*marks)
+            except tk.TclError:
+                pass  # 组件已随标签页关闭而销毁
+
+        self._job = self.root.after(TYPING_EFFECT_TICK_MS, self._tick) if self.queue else None
+
+
+# --- 运行输出 ---
+
+class OutputPump:
+    """运行窗口的输出缓冲泵。
+
+    读取线程只把原始数据块追加到带锁的缓冲区（以及可选的日志文件），不接触任何Tk组件；
+    UI线程上的单个定时任务每 OUTPUT_FRAME_MS 毫秒取空缓冲区，一次性交给 on_frame 回调。
+    """
+
+    def __init__(self, root, on_frame):
+        self.root = root
+        self.on_frame = on_frame
+        self._lock = threading.Lock()
+        self._pending = []  # [(输出流tag, 文本)]
+        self._log = None
+        self._closed = False
+        self._job = root.after(OUTPUT_FRAME_MS, self._tick)
+
+    def write(self, tag, data):
+        """可在任意线程调用。"""
+        with self._lock:
+            if self._log:
+                self._log.write(data)
+            if not self._closed:
+                self._pending.append((tag, data))
+
+    def open_log(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock:
+            if not self._log:
+                self._log = open(path, 'w', encoding='utf-8')
+
+    def close_log(self):
+        with self._lock:
+            if self._log:
+                self._log.close()
+                self._log = None
+
+    def close(self):
+        """输出窗口关闭时调用：停止刷新；日志文件在进程结束前仍会继续写入。"""
+        self._closed = True
+        if self._job:
+            self.root.after_cancel(self._job)
+            self._job = None
+
+    def _tick(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if pending:
+            try:
+                self.on_frame(pending)
+            except tk.TclError:
+                self.close()  # 输出窗口已被销毁
+                return
+        self._job = self.root.after(OUTPUT_FRAME_MS, self._tick)
+
+
+class WarmWorkerPool:
+    """“快速运行”所用的预热解释器进程池。
+
+    进程预先启动并导入 WARM_PRELOAD_MODULES，运行脚本时直接取一个空闲进程，省去解释器启动和重型导入的时间。
+    每个进程只运行一个脚本，用完即弃，由后台线程补充新的进程。IDE退出时进程的stdin被关闭，它们会自行退出。
+    """
+
+    def __init__(self, size=WARM_POOL_SIZE, modules=WARM_PRELOAD_MODULES):
+        self.size = size
+        self.modules = list(modules)
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _spawn(self):
+        """启动一个预热进程。非 Windows 平台上另开一个管道，进程在运行脚本之前从这里报告预热阶段的资源用量。"""
+        import subprocess
+        env, pass_fds, usage_read = None, (), None
+        if sys.platform != 'win32':
+            usage_read, usage_write = os.pipe()
+            env, pass_fds = dict(os.environ, FUNKYIDE_USAGE_FD=str(usage_write)), (usage_write,)
+        # -u：输出经管道时不做块缓冲，脚本的print能及时出现在输出窗口中
+        process = subprocess.Popen([sys.executable, '-u', '-c', _WARM_WORKER_CODE] + self.modules,
+                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env,
+                                   pass_fds=pass_fds,
+                                   creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0)
+        process.preload_fd = usage_read
+        if usage_read is not None:
+            os.close(usage_write)
+        return process
+
+    @staticmethod
+    def preload_usage(process):
+        """进程结束后调用：返回预热阶段的 (用户CPU秒, 系统CPU秒, ru_maxrss)，不是预热进程或没有报告时返回None。"""
+        fd = getattr(process, 'preload_fd', None)
+        if fd is None: return None
+        process.preload_fd = None
+        try:
+            utime, stime, maxrss = os.read(fd, 256).split()
+            return float(utime), float(stime), int(maxrss)
+        except (OSError, ValueError):
+            return None
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _discard(process):
+        process.kill()
+        if process.preload_fd is not None:
+            os.close(process.preload_fd)
+            process.preload_fd = None
+
+    def refill(self):
+        """在后台线程中把空闲进程补足到 size 个。"""
+        threading.Thread(target=self._refill, daemon=True).start()
+
+    def _refill(self):
+        while True:
+            with self._lock:
+                if self._closed or len(self._idle) >= self.size:
+                    return
+            process = self._spawn()
+            with self._lock:
+                if self._closed:
+                    self._discard(process)
+                    return
+                self._idle.append(process)
+
+    def run(self, script_path):
+        """取一个空闲进程运行脚本并返回它；没有空闲进程时当场启动一个。"""
+        process = None
+        with self._lock:
+            while self._idle:
+                candidate = self._idle.popleft()
+                if candidate.poll() is None:
+                    process = candidate
+                    break
+                self._discard(candidate)
+        if process is None:
+            process = self._spawn()
+        process.stdin.write((script_path + '\n').encode('utf-8'))
+        process.stdin.close()
+        process.stdin = None  # 之后的 wait()/communicate() 不应再碰已关闭的stdin
+        self.refill()
+        return process
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+        for process in idle:
+            self._discard(process)
+
+
+# --- 文件列表 ---
+
+class DirectoryWatcher:
+    """在后台线程中维护工作目录下的文件名集合。
+
+    首次用 os.scandir 列出全部文件，之后在 Linux 上通过 inotify 接收增删改事件，其他平台定期重新扫描，
+    比较每个文件的修改时间和大小。每批变化以 on_change(added, removed, modified, reset) 的形式通过 root.after
+    交回UI线程，modified 是内容被改写或被原子替换的已有文件，reset=True 表示 added 是完整的文件列表。
+    """
+
+    def __init__(self, root, path, on_change):
+        self.root = root
+        self.path = path
+        self.on_change = on_change
+        self.known = set()  # 只在后台线程中访问
+        self.stamps = {}  # 轮询模式下每个文件的 (mtime_ns, size)；inotify 模式下修改由事件报告，不记录
+        self._inotify = False
+        self._stopped = False
+        self._force_rescan = False
+        self._wake = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+
+    def rescan(self):
+        """请求后台线程尽快完整地重新扫描一次。"""
+        self._force_rescan = True
+        self._wake.set()
+
+    def _scan(self):
+        """返回 {文件名: (mtime_ns, size)}；inotify 模式下不必逐个 stat，值都为None。"""
+        result = {}
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                if not entry.is_file(): continue
+                if self._inotify:
+                    result[entry.name] = None
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue  # 扫描途中被删除
+                result[entry.name] = (st.st_mtime_ns, st.st_size)
+        return result
+
+    def _emit(self, added, removed, modified=(), reset=False):
+        try:
+            self.root.after(0, self.on_change, added, removed, modified, reset)
+        except RuntimeError:
+            self._stopped = True  # 主窗口已经关闭
+
+    def _rescan(self, reset=False):
+        try:
+            stamps = self._scan()
+        except OSError as e:
+            msg = f"无法读取文件列表:\n{e}"  # e 在 except 块结束时即被删除，不能留给延迟执行的回调
+            self.root.after(0, lambda m=msg: messagebox.showerror("错误", m))
+            return
+        names = set(stamps)
+        added, removed = names - self.known, self.known - names
+        modified = {name for name, stamp in stamps.items()
+                    if stamp is not None and self.stamps.get(name, stamp) != stamp}
+        self.known, self.stamps = names, stamps
+        if reset or added or removed or modified:
+            self._emit(names if reset else added, removed, set() if reset else modified, reset)
+
+    def _run(self):
+        # 先开始监视再做首次扫描，这样两者之间发生的变化也不会遗漏
+        fd = self._open_inotify()
+        self._inotify = fd is not None
+        if fd is None:
+            self._watch_poll()
+        else:
+            self._rescan(reset=True)
+            self._watch_inotify(fd)
+
+    def _watch_poll(self):
+        # 原地改写文件不会改变目录的修改时间，所以每次都完整扫描并比较各文件的修改时间和大小
+        self._rescan(reset=True)
+        while not self._stopped:
+            self._wake.wait(FILE_POLL_INTERVAL)
+            self._wake.clear()
+            self._force_rescan = False
+            self._rescan()
+
+    def _open_inotify(self):
+        """创建监视工作目录的 inotify 描述符；当前平台不支持时返回 None。"""
+        if not sys.platform.startswith('linux'):
+            return None
+        import ctypes, ctypes.util  # 只在后台监视线程中用到
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK)
+        except (OSError, AttributeError):
+            return None
+        if fd < 0:
+            return None
+        mask = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_CLOSE_WRITE | IN_DELETE_SELF | IN_MOVE_SELF
+        if libc.inotify_add_watch(fd, os.fsencode(self.path), mask) < 0:
+            os.close(fd)
+            return None
+        return fd
+
+    def _watch_inotify(self, fd):
+        try:
+            while not self._stopped:
+                readable, _, _ = select.select([fd], [], [], 0.5)
+                if self._force_rescan:
+                    self._force_rescan = False
+                    self._rescan()
+                if not readable:
+                    continue
+                time.sleep(0.05)  # 稍等片刻，把一连串事件合并成一批
+                added, removed, modified, overflow = set(), set(), set(), False
+                while True:
+                    try:
+                        data = os.read(fd, 65536)
+                    except BlockingIOError:
+                        break
+                    offset = 0
+                    while offset < len(data):
+                        _, event_mask, _, length = struct.unpack_from('iIII', data, offset)
+                        name = os.fsdecode(data[offset + 16:offset + 16 + length].rstrip(b'\0'))
+                        offset += 16 + length
+                        if event_mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                            return  # 工作目录本身不见了
+                        if event_mask & IN_Q_OVERFLOW:
+                            overflow = True
+                        elif event_mask & IN_ISDIR:
+                            continue
+                        elif event_mask & (IN_CREATE | IN_MOVED_TO):
+                            added.add(name)
+                            removed.discard(name)
+                        elif event_mask & (IN_DELETE | IN_MOVED_FROM):
+                            removed.add(name)
+                            added.discard(name)
+                            modified.discard(name)
+                        elif event_mask & IN_CLOSE_WRITE:
+                            modified.add(name)
+                if overflow:
+                    self._rescan()  # 事件队列溢出，只能完整扫描一次
+                    continue
+                # 只对发生变化的条目做检查，开销与变化数量成正比
+                modified |= added & self.known  # 已有的文件被改名覆盖（原子替换）
+                added = {name for name in added - self.known if os.path.isfile(os.path.join(self.path, name))}
+                removed &= self.known
+                modified = (modified & self.known) - removed
+                if added or removed or modified:
+                    self.known = (self.known | added) - removed
+                    self._emit(added, removed, modified)
+        finally:
+            os.close(fd)
+
+
+class VirtualFileList(Frame):
+    """只绘制可见行的文件列表，带“输入即过滤”的搜索框。
+
+    文件名保存在有序列表中，增删时用二分查找定位；画布上只有一屏的文本项，滚动时复用它们，
+    因此目录里有几万个文件也不会拖慢界面。双击或回车时以文件名调用 on_open。
+    """
+
+    def __init__(self, master, on_open):
+        super().__init__(master)
+        self.on_open = on_open
+        self.items = []  # 全部文件名，已排序
+        self.view = self.items  # 通过过滤的文件名，已排序；没有过滤条件时就是 items 本身
+        self.selected = None  # 选中的文件名
+        self.top = 0  # 第一个可见行在 view 中的位置
+        self._pattern = ""
+        self._filter_job = None
+        self._render_job = None
+        self._row_items = []  # 复用的画布文本项
+        self._row_texts = []  # 各文本项当前显示的内容，内容不变时省掉一次 itemconfigure
+
+        self.filter_var = tk.StringVar()
+        filter_entry = tk.Entry(self, textvariable=self.filter_var)
+        filter_entry.pack(fill="x", pady=(0, 5))
+        self.filter_var.trace_add("write", lambda *args: self._schedule_filter())
+
+        body = Frame(self)
+        body.pack(fill="both", expand=True)
+        self.font = tkfont.nametofont("TkDefaultFont")
+        self.row_height = self.font.metrics("linespace") + 4
+        self.canvas = tk.Canvas(body, width=200, bg="white", highlightthickness=1, takefocus=1)
+        self.canvas.pack(side="left", fill="both", expand=True)
+        self.scrollbar = Scrollbar(body, orient="vertical", command=self.yview)
+        self.scrollbar.pack(side="right", fill="y")
+        self._selection_rect = self.canvas.create_rectangle(0, 0, 0, 0, fill="#cce8ff", outline="", state="hidden")
+
+        self.canvas.bind("<Configure>", lambda e: self._schedule_render())
+        self.canvas.bind("<Button-1>", self._on_click)
+        self.canvas.bind("<Double-1>", lambda e: self._open_selected())
+        self.canvas.bind("<Return>", lambda e: self._open_selected())
+        self.canvas.bind("<Up>", lambda e: self._move_selection(-1))
+        self.canvas.bind("<Down>", lambda e: self._move_selection(1))
+        self.canvas.bind("<MouseWheel>", lambda e: self.yview("scroll", -1 if e.delta > 0 else 1, "units"))
+        self.canvas.bind("<Button-4>", lambda e: self.yview("scroll", -3, "units"))
+        self.canvas.bind("<Button-5>", lambda e: self.yview("scroll", 3, "units"))
+
+    # 数据
+
+    def set_items(self, names):
+        self.items = sorted(names)
+        self._apply_filter()
+
+    def apply_changes(self, added=(), removed=()):
+        """只对变化的文件名做二分插入/删除。"""
+        filtered = self.view is not self.items
+        for name in removed:
+            self._remove(self.items, name)
+            if filtered:
+                self._remove(self.view, name)
+            if name == self.selected:
+                self.selected = None
+        for name in added:
+            self._insert(self.items, name)
+            if filtered and self._matches(name):
+                self._insert(self.view, name)
+        self._schedule_render()
+
+    @staticmethod
+    def _insert(names, name):
+        i = bisect.bisect_left(names, name)
+        if i == len(names) or names[i] != name:
+            names.insert(i, name)
+
+    @staticmethod
+    def _remove(names, name):
+        i = bisect.bisect_left(names, name)
+        if i < len(names) and names[i] == name:
+            del names[i]
+
+    def _matches(self, name):
+        return self._pattern in name.lower()
+
+    def _schedule_filter(self):
+        if self._filter_job:
+            self.after_cancel(self._filter_job)
+        self._filter_job = self.after(FILE_FILTER_DELAY_MS, self._apply_filter)
+
+    def _apply_filter(self):
+        self._filter_job = None
+        self._pattern = self.filter_var.get().strip().lower()
+        self.view = [name for name in self.items if self._matches(name)] if self._pattern else self.items
+        self.top = 0
+        self._schedule_render()
+
+    # 绘制
+
+    def _visible_rows(self):
+        return max(1, self.canvas.winfo_height() // self.row_height)
+
+    def _schedule_render(self):
+        if self._render_job is None:
+            self._render_job = self.after_idle(self._render)
+
+    def _render(self):
+        self._render_job = None
+        rows = self._visible_rows()
+        total = len(self.view)
+        self.top = max(0, min(self.top, total - rows))
+
+        while len(self._row_items) < rows + 1:
+            y = len(self._row_items) * self.row_height + 2
+            self._row_items.append(self.canvas.create_text(4, y, anchor="nw", text="", font=self.font))
+            self._row_texts.append("")
+        for i, item in enumerate(self._row_items):
+            index = self.top + i
+            text = self.view[index] if index < total and i <= rows else ""
+            if text != self._row_texts[i]:
+                self.canvas.itemconfigure(item, text=text)
+                self._row_texts[i] = text
+
+        index = self._index_of(self.selected)
+        if index is not None and self.top <= index <= self.top + rows:
+            y = (index - self.top) * self.row_height
+            self.canvas.coords(self._selection_rect, 0, y, self.canvas.winfo_width(), y + self.row_height)
+            self.canvas.itemconfigure(self._selection_rect, state="normal")
+        else:
+            self.canvas.itemconfigure(self._selection_rect, state="hidden")
+
+        if total:
+            self.scrollbar.set(self.top / total, min(1.0, (self.top + rows) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def _index_of(self, name):
+        if name is None:
+            return None
+        i = bisect.bisect_left(self.view, name)
+        return i if i < len(self.view) and self.view[i] == name else None
+
+    def yview(self, *args):
+        """供滚动条和鼠标滚轮调用，参数格式与 Tk 的 yview 命令相同。"""
+        rows = self._visible_rows()
+        if args[0] == "moveto":
+            self.top = int(float(args[1]) * len(self.view))
+        elif args[0] == "scroll":
+            step = rows if args[2] == "pages" else 1
+            self.top += int(args[1]) * step
+        self._schedule_render()
+
+    # 交互
+
+    def _on_click(self, event):
+        self.canvas.focus_set()
+        index = self.top + event.y // self.row_height
+        self.selected = self.view[index] if index < len(self.view) else None
+        self._schedule_render()
+
+    def _move_selection(self, step):
+        if not self.view:
+            return
+        index = self._index_of(self.selected)
+        index = 0 if index is None else max(0, min(len(self.view) - 1, index + step))
+        self.selected = self.view[index]
+        rows = self._visible_rows()
+        if index < self.top:
+            self.top = index
+        elif index >= self.top + rows:
+            self.top = index - rows + 1
+        self._schedule_render()
+
+    def _open_selected(self):
+        if self.selected is not None:
+            self.on_open(self.selected)
+
+
+class ScriptRun:
+    """一次脚本运行：launcher 是启动并返回 Popen 对象的函数，输出写入 pump。"""
+
+    def __init__(self, script_path, pump, launcher):
+        self.script_path = script_path
+        self.pump = pump
+        self.launcher = launcher
+        self.process = None
+        self.state = 'queued'  # queued / running / finished / cancelled
+        self.stop_signal = None  # 进程启动前就收到的停止请求
+
+
+class RunManager:
+    """跟踪所有从IDE启动的脚本进程：限制并发数量、支持停止/强制结束，并在结束时报告资源占用。
+
+    POSIX 下用 os.wait4 回收进程，从而拿到用户/系统CPU时间与峰值内存。
+    """
+
+    def __init__(self, reader, max_concurrent=MAX_CONCURRENT_RUNS):
+        self.reader = reader  # reader(pipe, tag, pump)，在读取线程中把管道内容写入输出泵
+        self.max_concurrent = max_concurrent
+        self.running = []
+        self.queue = deque()
+        self._lock = threading.Lock()
+
+    def submit(self, run):
+        with self._lock:
+            start = len(self.running) < self.max_concurrent
+            if start:
+                self.running.append(run)
+                run.state = 'running'
+            else:
+                self.queue.append(run)
+                position = len(self.queue)
+        if start:
+            threading.Thread(target=self._execute, args=(run,), daemon=True).start()
+        else:
+            run.pump.write('lightgreen', f"--- 已有 {self.max_concurrent} 个脚本在运行，排队中（第 {position} 位）---\n")
+
+    def stop(self, run, kill=False):
+        """停止一次运行：排队中的直接取消，运行中的发送 SIGTERM（kill=True 时为 SIGKILL）。"""
+        with self._lock:
+            if run.state == 'queued':
+                self.queue.remove(run)
+                run.state = 'cancelled'
+                run.pump.write('red', "--- 已取消 ---\n")
+                return
+            if run.state != 'running':
+                return
+            if run.process is None:
+                run.stop_signal = kill
+                return
+        self._signal(run.process, kill)
+
+    def stop_all(self, kill=False):
+        with self._lock:
+            runs = list(self.queue) + list(self.running)
+        for run in runs:
+            self.stop(run, kill)
+
+    def _signal(self, process, kill):
+        if process.returncode is not None:
+            return
+        try:
+            if sys.platform == 'win32':
+                process.kill() if kill else process.terminate()
+            else:
+                # 直接发信号而不经过 Popen.terminate()，避免它的 poll() 抢先回收进程、丢失资源统计
+                os.kill(process.pid, signal.SIGKILL if kill else signal.SIGTERM)
+        except OSError:
+            pass  # 进程已经退出
+
+    def _execute(self, run):
+        pump = run.pump
+        try:
+            process = run.launcher()
+        except Exception as e:
+            pump.write('red', f"\n--- 启动失败 ---\n{e}")
+            pump.close_log()
+            self._finish(run)
+            return
+
+        started = time.monotonic()
+        with self._lock:
+            run.process = process
+            stop_signal = run.stop_signal
+        if stop_signal is not None:
+            self._signal(process, stop_signal)
+
+        readers = [threading.Thread(target=self.reader, args=(process.stdout, 'lightgreen', pump), daemon=True),
+                   threading.Thread(target=self.reader, args=(process.stderr, 'red', pump), daemon=True)]
+        for reader in readers:
+            reader.start()
+        code, usage = self._wait(process)
+        preload = WarmWorkerPool.preload_usage(process)
+        wall = time.monotonic() - started
+        for reader in readers:
+            reader.join(timeout=1.0)  # 让摘要出现在全部输出之后；子进程的子进程可能还占着管道，不无限等待
+
+        summary = f"退出码 {code} | 耗时 {wall:.2f}s"
+        if usage is not None:
+            rss_unit = 1024 * 1024 if sys.platform == 'darwin' else 1024  # macOS 以字节为单位
+            utime, stime = usage.ru_utime, usage.ru_stime
+            if preload:  # 预热进程的用量从启动时算起，减去解释器启动和预加载模块的部分
+                utime, stime = max(0.0, utime - preload[0]), max(0.0, stime - preload[1])
+            summary += f" | 用户CPU {utime:.2f}s | 系统CPU {stime:.2f}s | 峰值内存 {usage.ru_maxrss / rss_unit:.1f} MB"
+            if preload:  # 峰值内存无法相减，注明其中预热时就已占用的部分
+                summary += f"（预热时已占 {preload[2] / rss_unit:.1f} MB）"
+        pump.write('lightgreen' if code == 0 else 'red', f"\n--- 进程结束: {summary} ---\n")
+        pump.close_log()  # 摘要也写进日志之后再关闭，读线程已经结束，不会再有输出
+        self._finish(run)
+
+    def _wait(self, process):
+        """等待进程结束，返回 (退出码, rusage或None)。"""
+        if hasattr(os, 'wait4'):
+            try:
+                _, status, usage = os.wait4(process.pid, 0)
+                process.returncode = os.waitstatus_to_exitcode(status)
+                return process.returncode, usage
+            except ChildProcessError:
+                pass  # 已被其他地方回收
+        return process.wait(), None
+
+    def _finish(self, run):
+        with self._lock:
+            run.state = 'finished'
+            if run in self.running:
+                self.running.remove(run)
+            next_run = None
+            if self.queue and len(self.running) < self.max_concurrent:
+                next_run = self.queue.popleft()
+                next_run.state = 'running'
+                self.running.append(next_run)
+        if next_run:
+            next_run.pump.write('lightgreen', "--- 开始运行 ---\n")
+            threading.Thread(target=self._execute, args=(next_run,), daemon=True).start()
+
+
+# --- 标签栏 ---
+
+class TabStrip(Frame):
+    """只为可见的标签创建组件的标签栏，放不下时用左右箭头滚动，或从“▾”菜单中选择。
+
+    标签的顺序和当前标签只记录在模型中；切换标签只重新设置新旧两个标签的颜色，打开或关闭一个标签
+    只创建或销毁它自己的组件（关闭时其后的可见标签左移）。滚出视野的组件留着复用。
+    标签用 place 摆放，鼠标悬停时由 on_enter/on_leave 调整高度和纵向位置实现弹跳效果。
+    """
+
+    def __init__(self, master, on_select, on_close, on_enter=None, on_leave=None):
+        super().__init__(master, height=35, bg=TAB_BAR_BG)
+        self.pack_propagate(False)  # 固定高度，不让子组件撑开
+        self.on_select = on_select
+        self.on_close = on_close
+        self.on_enter = on_enter
+        self.on_leave = on_leave
+        self.names = []  # 全部标签，按显示顺序
+        self.active = None
+        self.first = 0  # 第一个可见标签在 names 中的位置
+        self.widgets = {}  # {文件名: 标签组件}，只有可见的标签才有
+        self.positions = {}  # {文件名: x}，位置不变时省掉一次 place_configure
+        self._spare = []  # 滚出视野后留待复用的标签组件
+        self._widths = {}  # {文件名: 标签宽度}
+        self._extra_width = None  # 标签中文字之外的宽度（内边距、关闭按钮和边框），第一次用到时量出来
+        self._end_x = 0  # 最后一个可见标签的右边缘
+        self._layout_job = None
+        self.font = tkfont.nametofont("TkDefaultFont")
+
+        self.menu_button = tk.Menubutton(self, text="▾", bg=TAB_BAR_BG, fg="white", relief="flat")
+        self.menu = tk.Menu(self.menu_button, tearoff=0, postcommand=self._fill_menu)
+        self.menu_button.config(menu=self.menu)
+        self.menu_button.pack(side="right", fill="y")
+        self.right_button = Button(self, text="▶", bg=TAB_BAR_BG, fg="white", relief="flat",
+                                   command=lambda: self.scroll(1))
+        self.right_button.pack(side="right", fill="y")
+        self.left_button = Button(self, text="◀", bg=TAB_BAR_BG, fg="white", relief="flat",
+                                  command=lambda: self.scroll(-1))
+        self.left_button.pack(side="left", fill="y")
+        self.strip = Frame(self, bg=TAB_BAR_BG)
+        self.strip.pack(side="left", fill="both", expand=True)
+        self.strip.bind("<Configure>", lambda e: self._schedule_layout())
+        self._bind_wheel(self)
+        self._bind_wheel(self.strip)
+        self._update_arrows()
+
+    def _bind_wheel(self, widget):
+        widget.bind("<MouseWheel>", lambda e: self.scroll(-1 if e.delta > 0 else 1))
+        widget.bind("<Button-4>", lambda e: self.scroll(-1))
+        widget.bind("<Button-5>", lambda e: self.scroll(1))
+
+    # 模型
+
+    def add(self, name):
+        """在末尾添加一个标签；只有它能直接放进可见区域时才为它创建组件。"""
+        self.names.append(name)
+        last = self.first + len(self.widgets)
+        if last == len(self.names) - 1 and self._fits(self._end_x, name):
+            self._show(name, self._end_x)
+            self._end_x += self._width(name)
+        self._update_arrows()
+
+    def remove(self, name):
+        index = self.names.index(name)
+        del self.names[index]
+        self._widths.pop(name, None)
+        if self.active == name: self.active = None
+        tab = self.widgets.pop(name, None)
+        if tab is not None:
+            del self.positions[name]
+            tab.destroy()
+            self._layout()  # 其后的可见标签左移，空出的位置可能放得下新的标签
+        elif index < self.first:
+            self.first -= 1
+            self._update_arrows()
+        else:
+            self._update_arrows()
+
+    def rename(self, old, new):
+        self.names[self.names.index(old)] = new
+        self._widths.pop(old, None)
+        if self.active == old: self.active = new
+        tab = self.widgets.pop(old, None)
+        if tab is not None:
+            self.widgets[new] = tab
+            self.positions[new] = self.positions.pop(old)
+            tab.filename = new
+            tab.label.config(text=new)
+            self._layout()  # 宽度可能变了
+
+    def set_active(self, name):
+        """只重新设置新旧两个标签的颜色；新标签不在可见区域时先滚动过去。"""
+        old, self.active = self.active, name
+        if old in self.widgets and old != name:
+            self._style(self.widgets[old], False)
+        if name not in self.widgets:
+            self._scroll_to(self.names.index(name))
+        self._style(self.widgets[name], True)
+
+    def clear(self):
+        for tab in list(self.widgets.values()) + self._spare:
+            tab.destroy()
+        self.names, self.widgets, self.positions, self._spare, self._widths = [], {}, {}, [], {}
+        self.active = None
+        self.first = 0
+        self._end_x = 0
+        self._update_arrows()
+
+    # 视图
+
+    def scroll(self, step):
+        first = max(0, min(self.first + step, len(self.names) - 1))
+        if first != self.first:
+            self.first = first
+            self._layout()
+
+    def _scroll_to(self, index):
+        """滚动到刚好能看到第 index 个标签：在左边就让它成为第一个，在右边就让它成为最后一个。"""
+        if index < self.first:
+            self.first = index
+        else:
+            width = self._strip_width()
+            x = self._width(self.names[index])
+            first = index
+            while first > 0 and x + self._width(self.names[first - 1]) <= width:
+                first -= 1
+                x += self._width(self.names[first])
+            self.first = first
+        self._layout()
+
+    def _schedule_layout(self):
+        if self._layout_job is None:
+            self._layout_job = self.after_idle(self._layout)
+
+    def _layout(self):
+        """从 first 开始摆放放得下的标签，只触及可见的标签，与标签总数无关。"""
+        self._layout_job = None
+        width = self._strip_width()
+        self.first = max(0, min(self.first, len(self.names) - 1))
+        last, x = self.first, 0
+        while last < len(self.names) and (last == self.first or self._fits(x, self.names[last], width)):
+            x += self._width(self.names[last])
+            last += 1
+        if last == len(self.names):  # 后面的标签都放下了，末尾还有空位时把前面的标签拉回来
+            while self.first > 0 and self._fits(x, self.names[self.first - 1], width):
+                self.first -= 1
+                x += self._width(self.names[self.first])
+        visible, x = {}, 0
+        for name in self.names[self.first:last]:
+            visible[name] = x
+            x += self._width(name)
+        self._end_x = x
+        for name in [name for name in self.widgets if name not in visible]:
+            tab = self.widgets.pop(name)
+            del self.positions[name]
+            tab.place_forget()
+            self._spare.append(tab)
+        for name, x in visible.items():
+            if name not in self.widgets:
+                self._show(name, x)
+            elif self.positions[name] != x:
+                self.positions[name] = x
+                self.widgets[name].place_configure(x=x)
+        self._update_arrows()
+
+    def _show(self, name, x):
+        tab = self._spare.pop() if self._spare else self._make_tab()
+        tab.filename = name
+        tab.label.config(text=name)
+        self._style(tab, name == self.active)
+        tab.place(x=x, y=0, relheight=1.0)
+        self.widgets[name] = tab
+        self.positions[name] = x
+
+    def _make_tab(self):
+        tab = Frame(self.strip, bg=TAB_INACTIVE_BG, borderwidth=1, relief="raised")
+        tab.label = Label(tab, bg=TAB_INACTIVE_BG, fg="white", padx=5)
+        tab.label.pack(side="left", fill="both", expand=True)
+        tab.close_button = Button(tab, text="×", bg=TAB_INACTIVE_BG, fg="white", relief="flat",
+                                  command=lambda: self.on_close(tab.filename))
+        tab.close_button.pack(side="right")
+        # 组件会被复用，回调里总是读取它当前对应的文件名
+        select = lambda e: self.on_select(tab.filename)
+        tab.bind("<Button-1>", select)
+        tab.label.bind("<Button-1>", select)
+        self._bind_wheel(tab)
+        self._bind_wheel(tab.label)
+        if self.on_enter: tab.bind("<Enter>", self.on_enter)
+        if self.on_leave: tab.bind("<Leave>", self.on_leave)
+        return tab
+
+    @staticmethod
+    def _style(tab, active):
+        bg = TAB_ACTIVE_BG if active else TAB_INACTIVE_BG
+        tab.config(bg=bg)
+        tab.label.config(bg=bg)
+        tab.close_button.config(bg=bg)
+
+    def _width(self, name):
+        """标签的宽度，按文字宽度估算，不需要先创建组件。"""
+        width = self._widths.get(name)
+        if width is None:
+            if self._extra_width is None:
+                probe = self._make_tab()
+                probe.label.config(text="x")
+                probe.update_idletasks()  # 计算出组件请求的尺寸
+                self._extra_width = probe.winfo_reqwidth() - self.font.measure("x")
+                self._spare.append(probe)
+            width = self._widths[name] = self.font.measure(name) + self._extra_width
+        return width
+
+    def _strip_width(self):
+        width = self.strip.winfo_width()
+        return width if width > 1 else self.winfo_toplevel().winfo_width()  # 还没有布局时按窗口宽度估计
+
+    def _fits(self, x, name, width=None):
+        return x + self._width(name) <= (self._strip_width() if width is None else width)
+
+    def _update_arrows(self):
+        last = self.first + len(self.widgets)
+        self.left_button.config(state="normal" if self.first > 0 else "disabled")
+        self.right_button.config(state="normal" if last < len(self.names) else "disabled")
+
+    def _fill_menu(self):
+        """展开“▾”菜单时才列出全部标签。"""
+        self.menu.delete(0, END)
+        for name in self.names:
+            label = f"● {name}" if name == self.active else f"   {name}"
+            self.menu.add_command(label=label, command=lambda n=name: self.on_select(n))
+
+
+# --- Markdown 预览 ---
+
+_FENCE_RE = re.compile(r'^ {0,3}(`{3,}|~{3,})')
+_LIST_ITEM_RE = re.compile(r'^ {0,3}([-*+]|\d+[.)])\s')
+_REF_DEF_RE = re.compile(r'^ {0,3}\[[^\]]+\]:[ \t]*\S.*$', re.M)
+_BLANK_RUN_RE = re.compile(r'(\n(?:[ \t]*\n)+)')
+_HEADING_RE = re.compile(r'^ {0,3}(#|([-*_])[ \t]*\2[ \t]*\2[-*_ \t]*$)')  # ATX标题或分隔线，它们之后的行不属于上面的列表
+_HTML_START_RE = re.compile(r'^(?:<!--|<([a-zA-Z][a-zA-Z0-9]*)(?=[\s/>]|$))')
+_HTML_VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'}
+
+
+def _scan_fences(paragraph, fence):
+    """逐行扫描一个段落，返回段落结束时仍未关闭的围栏代码块的结束标记（没有则为None）。"""
+    for line in paragraph.split('\n'):
+        if fence:
+            if line.lstrip().startswith(fence): fence = None
+        else:
+            m = _FENCE_RE.match(line)
+            if m: fence = m.group(1)
+    return fence
+
+
+def _ends_in_list(paragraph, in_list):
+    """段落结束时是否处于列表中。只看顶格的行：列表项开始列表，标题和分隔线结束列表，
+    其余的顶格行在段首时是普通段落，在段中时是列表项的惰性续行。"""
+    for i, line in enumerate(paragraph.split('\n')):
+        if not line or line[0].isspace(): continue
+        if _LIST_ITEM_RE.match(line):
+            in_list = True
+        elif i == 0 or _HEADING_RE.match(line):
+            in_list = False
+    return in_list
+
+
+def _scan_html(paragraph, html):
+    """返回段落结束时仍未关闭的原始HTML块 (标签名, 嵌套层数)，没有则为None。
+
+    Python-Markdown 中以块级标签开头的原始HTML一直延续到对应的结束标签为止，中间可以有空行。
+    """
+    if html is None:
+        m = _HTML_START_RE.match(paragraph)
+        if not m or (m.group(1) or '').lower() in _HTML_VOID_TAGS: return None
+        html = (m.group(1).lower() if m.group(1) else None, 0)
+    tag, depth = html
+    if tag is None:  # HTML注释
+        return None if '-->' in paragraph else html
+    depth += len(re.findall(rf'<{tag}(?=[\s>])', paragraph, re.I)) - len(re.findall(rf'</{tag}\s*>', paragraph, re.I))
+    return (tag, depth) if depth > 0 else None
+
+
+def split_markdown_blocks(text):
+    """把Markdown文本切成可以各自独立渲染的顶层块。
+
+    块以空行分隔；围栏代码块、原始HTML块、缩进的续行、被空行隔开的同一个列表和相邻的引用段落都归入同一块。
+    """
+    parts = _BLANK_RUN_RE.split(text.lstrip('\n'))  # 段落与其间的空行交替出现
+    blocks, current = [], None
+    fence = None  # 当前所在围栏代码块的结束标记
+    html = None  # 当前所在原始HTML块的 (标签名, 嵌套层数)
+    in_list = False  # 上一段结束时是否处于列表中
+    in_quote = False  # 上一段是否是引用
+    for i in range(0, len(parts), 2):
+        paragraph = parts[i]
+        if not paragraph.strip(): continue
+        quote = paragraph.lstrip(' ').startswith('>')
+        if current is not None and (fence or html or paragraph[0].isspace() or (in_quote and quote)
+                                    or (in_list and _LIST_ITEM_RE.match(paragraph))):
+            current += parts[i - 1] + paragraph
+        else:
+            if current is not None: blocks.append(current.rstrip('\n'))
+            current = paragraph
+            in_list = False
+        in_list, in_quote = _ends_in_list(paragraph, in_list), quote
+        if html or not fence:
+            html = _scan_html(paragraph, html)
+        if fence or '```' in paragraph or '~~~' in paragraph:
+            fence = _scan_fences(paragraph, fence)
+    if current is not None:
+        blocks.append(current.rstrip('\n'))
+    return blocks
+
+
+class MarkdownBlockRenderer:
+    """复用同一个 markdown.Markdown 实例，按块缓存HTML，只重新渲染改动过的块。"""
+
+    def __init__(self):
+        import markdown
+        self.md = markdown.Markdown(extensions=['fenced_code', 'tables'])
+        self.cache = {}  # {块源码: (内容哈希, html)}，只保留最近一次渲染中还存在的块
+
+    def render(self, text):
+        """返回 [(内容哈希, html), ...]。引用式链接的定义会附加到每个块上，以便跨块引用。"""
+        refs = '\n'.join(_REF_DEF_RE.findall(text))
+        blocks, cache = [], {}
+        for block in split_markdown_blocks(text):
+            source = block + '\n\n' + refs if refs else block
+            entry = cache.get(source) or self.cache.get(source)
+            if entry is None:
+                key = hashlib.blake2b(source.encode('utf-8'), digest_size=8).hexdigest()
+                entry = (key, self.md.reset().convert(source))
+            cache[source] = entry
+            blocks.append(entry)
+        self.cache = cache
+        return blocks
+
+
+def _live_preview_handler():
+    """返回实时预览的请求处理类。http.server 导入较慢，所以第一次预览时才定义。"""
+    from http.server import BaseHTTPRequestHandler
+
+    class _LivePreviewHandler(BaseHTTPRequestHandler):
+        """'/' 返回预览页面，'/events' 是推送块更新的SSE流。"""
+
+        def do_GET(self):
+            preview = self.server.preview
+            if self.path == '/':
+                body = (_LIVE_PREVIEW_PAGE % PREVIEW_STYLE).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            elif self.path == '/events':
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Cache-Control', 'no-cache')
+                self.end_headers()
+                try:
+                    preview.stream(self.wfile)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+            else:
+                self.send_error(404)
+
+        def log_message(self, format, *args):
+            pass  # 不在控制台刷访问日志
+
+    return _LivePreviewHandler
+
+
+class LivePreviewServer:
+    """本机的实时预览服务器。浏览器只需打开一次页面，之后的改动都通过SSE推送，并且只传输浏览器中还没有的块。"""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.version = 0
+        self.title = ""
+        self.blocks = []
+        self.closed = False
+        from http.server import ThreadingHTTPServer
+        self.httpd = ThreadingHTTPServer((LIVE_PREVIEW_HOST, 0), _live_preview_handler())
+        self.httpd.daemon_threads = True
+        self.httpd.preview = self
+        self.url = f"http://{LIVE_PREVIEW_HOST}:{self.httpd.server_port}/"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def publish(self, title, blocks):
+        """发布新版本的文档，所有已连接的页面都会收到更新。可以在任意线程调用。"""
+        with self.cond:
+            self.title, self.blocks = title, blocks
+            self.version += 1
+            self.cond.notify_all()
+
+    def stream(self, wfile):
+        """在请求线程中运行：每有新版本就推送一次，空闲时定期发送注释行保持连接。"""
+        version, sent = 0, set()
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.closed or self.version != version, timeout=15)
+                if self.closed: return
+                changed = self.version != version
+                version, title, blocks = self.version, self.title, self.blocks
+            if not changed:
+                wfile.write(b": keepalive\n\n")
+                wfile.flush()
+                continue
+            payload = [[key, None if key in sent else html] for key, html in blocks]
+            sent = {key for key, _ in blocks}
+            message = json.dumps({'title': title, 'blocks': payload}, ensure_ascii=False)
+            wfile.write(f"data: {message}\n\n".encode('utf-8'))
+            wfile.flush()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        # shutdown() 会等待服务循环退出，放到后台线程以免卡住界面
+        threading.Thread(target=lambda: (self.httpd.shutdown(), self.httpd.server_close()), daemon=True).start()
+
+
+# --- 批量导出 ---
+
+def _atomic_write(path, data, fsync="never"):
+    """先写入同目录下的临时文件再替换，读者永远不会看到写了一半的文件。fsync 的取值见 SAVE_FSYNC。"""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            if fsync != "never":
+                f.flush()
+                os.fsync(f.fileno())
+        try:
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o7777)  # 保留原文件的权限
+        except OSError:
+            pass
+        os.replace(tmp_path, path)
+        if fsync == "full" and os.name == 'posix':
+            dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+    except BaseException:
+        try: os.remove(tmp_path)
+        except OSError: pass
+        raise
+
+
+def _file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+
+
+_export_md = None  # 每个导出进程复用的 markdown.Markdown 实例
+
+
+def _export_markdown_file(source_dir, target_dir, rel_path):
+    """渲染一个Markdown文件并写出对应的HTML，在进程池的工作进程中运行。返回 (相对路径, 错误信息或None)。"""
+    global _export_md
+    if _export_md is None:
+        import markdown
+        _export_md = markdown.Markdown(extensions=['fenced_code', 'tables'])
+    try:
+        with open(os.path.join(source_dir, rel_path), 'r', encoding='utf-8') as f:
+            body = _export_md.reset().convert(f.read())
+        out_rel = _export_target(rel_path)
+        out_path = os.path.join(target_dir, out_rel)
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        style_href = os.path.relpath(os.path.join(target_dir, EXPORT_STYLE_NAME),
+                                     os.path.dirname(out_path)).replace(os.sep, '/')
+        title = rel_path.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+        _atomic_write(out_path, (_EXPORT_PAGE % (title, style_href, body)).encode('utf-8'))
+        return rel_path, None
+    except Exception as e:
+        return rel_path, str(e)
+
+
+def _export_target(rel_path):
+    return os.path.splitext(rel_path)[0] + '.html'
+
+
+def _walk_markdown(source_dir, skip_dir):
+    """列出源目录下所有Markdown文件的相对路径及其 (mtime_ns, size)，跳过隐藏目录与导出目录本身。"""
+    found = {}
+    skip_dir = os.path.realpath(skip_dir)
+    for dirpath, dirnames, filenames in os.walk(source_dir):
+        dirnames[:] = [d for d in dirnames if not d.startswith('.')
+                       and os.path.realpath(os.path.join(dirpath, d)) != skip_dir]
+        for name in filenames:
+            if os.path.splitext(name.lower())[1] not in ('.md', '.markdown'): continue
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            found[os.path.relpath(path, source_dir)] = (st.st_mtime_ns, st.st_size)
+    return found
+
+
+def export_markdown_tree(source_dir, target_dir, workers=None):
+    """把 source_dir 下的所有Markdown增量导出为HTML，镜像到 target_dir。
+
+    修改时间和大小都没变的文件直接跳过；变了的再比较内容哈希。需要渲染的文件较多时交给进程池并行处理。
+    返回 {'exported': [...], 'skipped': n, 'removed': [...], 'errors': {相对路径: 错误信息}}。
+    """
+    os.makedirs(target_dir, exist_ok=True)
+    manifest_path = os.path.join(target_dir, EXPORT_MANIFEST_NAME)
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)  # {相对路径: {'mtime_ns', 'size', 'hash'}}
+    except (OSError, ValueError):
+        manifest = {}
+
+    style_path = os.path.join(target_dir, EXPORT_STYLE_NAME)
+    style = PREVIEW_STYLE.encode('utf-8')
+    try:
+        with open(style_path, 'rb') as f:
+            style_current = f.read() == style
+    except OSError:
+        style_current = False
+    if not style_current:
+        _atomic_write(style_path, style)
+
+    sources = _walk_markdown(source_dir, target_dir)
+    pending, skipped = {}, 0  # pending: {相对路径: 新的清单条目}
+    touched = False  # 是否有只需更新清单的条目
+    for rel, (mtime_ns, size) in sources.items():
+        entry = manifest.get(rel)
+        output_exists = os.path.exists(os.path.join(target_dir, _export_target(rel)))
+        if entry and output_exists and entry['mtime_ns'] == mtime_ns and entry['size'] == size:
+            skipped += 1
+            continue
+        try:
+            digest = _file_digest(os.path.join(source_dir, rel))
+        except OSError:
+            continue
+        new_entry = {'mtime_ns': mtime_ns, 'size': size, 'hash': digest}
+        if entry and output_exists and entry['hash'] == digest:
+            manifest[rel] = new_entry  # 只是被“碰”了一下，内容没变
+            skipped += 1
+            touched = True
+        else:
+            pending[rel] = new_entry
+
+    errors, exported = {}, []
+    if len(pending) >= EXPORT_POOL_MIN_FILES:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_export_markdown_file, [source_dir] * len(pending),
+                                    [target_dir] * len(pending), list(pending), chunksize=8))
+    else:
+        results = [_export_markdown_file(source_dir, target_dir, rel) for rel in pending]
+    for rel, error in results:
+        if error:
+            errors[rel] = error
+            manifest.pop(rel, None)
+        else:
+            manifest[rel] = pending[rel]
+            exported.append(rel)
+
+    # 源文件已被删除的，连同导出的HTML一起清理
+    removed = [rel for rel in manifest if rel not in sources]
+    for rel in removed:
+        del manifest[rel]
+        try: os.remove(os.path.join(target_dir, _export_target(rel)))
+        except OSError: pass
+
+    if exported or removed or errors or touched:
+        _atomic_write(manifest_path, json.dumps(manifest, ensure_ascii=False, indent=1).encode('utf-8'))
+    return {'exported': exported, 'skipped': skipped, 'removed': removed, 'errors': errors}
+
+
+# --- 后台保存 ---
+
+class BackgroundWriter:
+    """在后台线程中原子地写文件。保存时只交出内容快照，界面不必等待磁盘。
+
+    同一文件尚未开始写入的多次保存会合并成一次，只写最新的内容；不同的文件由多个线程并行写入。
+    写完后通过 root.after 在界面线程调用回调 on_done(error)，成功时 error 为 None。
+    """
+
+    def __init__(self, root, threads=SAVE_WRITER_THREADS, fsync=SAVE_FSYNC):
+        self.root = root
+        self.fsync = fsync
+        self.cond = threading.Condition()
+        self.pending = {}  # {路径: (内容, [回调...])}，按提交顺序排列
+        self.writing = set()  # 正在写入的路径，同一文件的两次写入不会同时进行
+        for _ in range(threads):
+            threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, path, content, on_done=None):
+        """提交一次写入。content 为 str 时按 UTF-8 编码，并像文本模式一样转换换行符。"""
+        with self.cond:
+            _, callbacks = self.pending.pop(path, (None, []))
+            if on_done: callbacks.append(on_done)
+            self.pending[path] = (content, callbacks)
+            self.cond.notify()
+
+    def idle(self):
+        """没有等待中或正在进行的写入时返回True。"""
+        with self.cond:
+            return not self.pending and not self.writing
+
+    def _next_path(self):
+        for path in self.pending:
+            if path not in self.writing: return path
+        return None
+
+    def _run(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self._next_path() is not None)
+                path = self._next_path()
+                content, callbacks = self.pending.pop(path)
+                self.writing.add(path)
+            error = None
+            try:
+                if isinstance(content, str):
+                    if os.linesep != '\n': content = content.replace('\n', os.linesep)
+                    content = content.encode('utf-8')
+                _atomic_write(path, content, self.fsync)
+            except Exception as e:
+                error = e
+            with self.cond:
+                self.writing.discard(path)
+                self.cond.notify_all()
+            for callback in callbacks:
+                self.root.after(0, callback, error)
+
+
+# --- 大文件 ---
+
+class LineIndex:
+    """内存映射大文件，并在后台线程中建立行偏移索引。
+
+    索引只记录每 LARGE_FILE_INDEX_CHUNK 字节之前有多少个换行符，内存占用与行数无关；
+    定位某一行时先二分找到所在的块，再在块内查找。
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.size = len(self.mm)
+        self.counts = [0]  # counts[i]: 前 i 块中的换行符数，由后台线程不断追加
+        self.done = False
+        self.closed = False
+        threading.Thread(target=self._build, daemon=True).start()
+
+    def _build(self):
+        total, pos = 0, 0
+        try:
+            while pos < self.size and not self.closed:
+                total += self.mm[pos:pos + LARGE_FILE_INDEX_CHUNK].count(b'\n')
+                pos += LARGE_FILE_INDEX_CHUNK
+                self.counts.append(total)
+        except ValueError:
+            return  # 索引建立期间文件被关闭
+        self.done = True
+
+    def line_count(self):
+        """已知的行数；索引尚未完成时只是下限。"""
+        return self.counts[-1] + 1
+
+    def offset(self, line):
+        """第 line 行（从0开始）的起始字节偏移；该行还没被索引到时返回None。"""
+        if line == 0: return 0
+        counts = self.counts
+        i = bisect.bisect_left(counts, line) - 1  # 第 line 个换行符所在的块
+        if i + 1 >= len(counts): return None
+        pos = i * LARGE_FILE_INDEX_CHUNK
+        for _ in range(line - counts[i]):
+            pos = self.mm.find(b'\n', pos) + 1
+        return pos
+
+    def read_lines(self, start, count):
+        """读取从第 start 行开始的至多 count 行，返回 (文本, 是否读到了文件末尾)；未索引到时返回None。"""
+        begin = self.offset(start)
+        if begin is None: return None
+        end, limit = begin, min(self.size, begin + LARGE_FILE_WINDOW_BYTES)
+        for _ in range(count):
+            newline = self.mm.find(b'\n', end, limit)
+            if newline < 0:
+                end = limit
+                break
+            end = newline + 1
+        at_eof = end >= self.size
+        return self.mm[begin:end].decode('utf-8', errors='replace'), at_eof
+
+    def close(self):
+        self.closed = True
+        self.mm.close()
+        self.file.close()
+
+
+class LargeFileView:
+    """以只读方式分页显示大文件：编辑区中只保留视口附近的一段行，滚动接近边缘时换入新的一段。"""
+
+    def __init__(self, text_widget, highlighter, path):
+        self.text = text_widget
+        self.highlighter = highlighter
+        self.index = LineIndex(path)
+        self.start = 0  # 当前窗口第一行在文件中的行号（从0开始）
+        self.loaded = 0  # 当前窗口的行数
+        self.at_eof = False
+        self._job = None
+        self.text.configure(undo=False, yscrollcommand=self._on_scroll)
+        self._load(0)
+
+    def _load(self, start, top=None):
+        """载入从 start 行开始的窗口，并让文件中的第 top 行保持在视口顶部。"""
+        result = self.index.read_lines(start, LARGE_FILE_WINDOW_LINES)
+        if result is None: return False
+        content, self.at_eof = result
+        self.text.configure(state="normal")
+        self.text.delete("1.0", END)
+        self.text.insert("1.0", content)
+        self.text.configure(state="disabled")
+        self.text.edit_modified(False)
+        self.start = start
+        self.loaded = int(self.text.index("end-1c").split('.')[0])
+        if top is not None:
+            self.text.yview(f"{top - start + 1}.0")
+        if self.highlighter.lexer is not None:
+            self.highlighter.highlight()  # 只高亮当前窗口
+        return True
+
+    def _on_scroll(self, first, last):
+        if self._job is None:
+            self._job = self.text.after_idle(self._check_window)
+
+    def _check_window(self):
+        """视口接近窗口的上下边缘时，以视口为中心重新载入窗口。"""
+        self._job = None
+        first = int(self.text.index("@0,0").split('.')[0]) - 1
+        last = int(self.text.index(f"@0,{self.text.winfo_height()}").split('.')[0]) - 1
+        margin = LARGE_FILE_WINDOW_LINES // 4
+        if (self.start > 0 and first < margin) or (not self.at_eof and last > self.loaded - margin):
+            top = self.start + first
+            new_start = max(0, top - LARGE_FILE_WINDOW_LINES // 2)
+            if new_start != self.start:
+                self._load(new_start, top)
+
+    def goto_line(self, line):
+        """跳到第 line 行（从1开始）。该行尚未被索引时返回False。"""
+        line = max(0, line - 1)
+        if not self._load(max(0, line - LARGE_FILE_WINDOW_LINES // 2), line): return False
+        self.text.mark_set(tk.INSERT, f"{line - self.start + 1}.0")
+        return True
+
+    def close(self):
+        if self._job: self.text.after_cancel(self._job)
+        self.index.close()
+
+
+# --- 全文搜索 ---
+
+def _trigrams(text):
+    """文本中所有（小写的）三字符片段。"""
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _index_files(paths):
+    """在进程池中运行：返回每个文件的 (mtime_ns, size, 三元组)，不可读的文件为None。
+
+    三元组拼接成一个字符串返回，比传回集合的序列化开销小得多。二进制文件和超过大文件阈值的文件不建立索引（三元组为None）。
+    """
+    results = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            trigrams = None
+            if st.st_size <= LARGE_FILE_THRESHOLD:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                if b'\0' not in data[:8192]:
+                    trigrams = ''.join(_trigrams(data.decode('utf-8', errors='replace')))
+            results.append((st.st_mtime_ns, st.st_size, trigrams))
+        except OSError:
+            results.append(None)
+    return results
+
+
+def _regex_literals(pattern):
+    """找出正则表达式的每个匹配都必然包含的字面量片段（至少3个字符），用于通过索引缩小候选文件。"""
+    try:
+        import re._parser as sre_parse
+    except ImportError:  # Python 3.10 及更早
+        import sre_parse
+    fragments, current = [], []
+
+    def flush():
+        if len(current) >= 3: fragments.append(''.join(current))
+        current.clear()
+
+    def walk(items):
+        for op, av in items:
+            name = str(op)
+            if name == 'LITERAL':
+                current.append(chr(av))
+            elif name == 'SUBPATTERN':
+                flush()
+                walk(av[-1])
+                flush()
+            elif name in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT') and av[0] >= 1:
+                flush()
+                walk(av[2])  # 至少重复一次，其中的片段也是必需的
+                flush()
+            else:
+                flush()  # 分支、字符集、锚点等：在此处截断片段
+
+    walk(sre_parse.parse(pattern))
+    flush()
+    return fragments
+
+
+def _find_matches(text, regex, limit):
+    """返回 [(行, 列, 结束行, 结束列, 该行文本)]，行号从1开始。"""
+    matches, line, last = [], 1, 0
+    for m in regex.finditer(text):
+        start, end = m.span()
+        if start == end: continue  # 跳过空匹配
+        line += text.count('\n', last, start)
+        last = start
+        line_start = text.rfind('\n', 0, start) + 1
+        line_end = text.find('\n', start)
+        if line_end < 0: line_end = len(text)
+        end_line = line + text.count('\n', start, end)
+        end_col = end - (text.rfind('\n', 0, end) + 1)
+        matches.append((line, start - line_start, end_line, end_col, text[line_start:line_end][:200]))
+        if len(matches) >= limit: break
+    return matches
+
+
+def _search_files(storage_path, names, pattern, flags, limit):
+    """在进程池或搜索线程中运行：逐个读取候选文件确认匹配，返回 [(文件名, 匹配列表)]。"""
+    regex = re.compile(pattern, flags)
+    results, total = [], 0
+    for name in names:
+        try:
+            with open(os.path.join(storage_path, name), 'r', encoding='utf-8', errors='replace') as f:
+                text = f.read()
+        except OSError:
+            continue
+        matches = _find_matches(text, regex, limit - total)
+        if matches:
+            results.append((name, matches))
+            total += len(matches)
+            if total >= limit: break
+    return results
+
+
+class WorkspaceIndex(abc.ABC):
+    """工作目录索引的公共部分：后台线程、任务队列、增量同步和磁盘缓存。
+
+    所有修改都由后台线程完成，大批文件交给进程池中的 worker 处理；索引空闲一段时间后写回磁盘，
+    下次启动时只需重新处理修改时间或大小变化了的文件。子类提供 worker、_store、_forget、_state 和 _restore。
+    """
+
+    worker = None  # 在进程池中运行的模块级函数：文件路径列表 -> 每个文件的结果（不可读时为None）
+    version = 1  # 磁盘上的索引格式，格式变化时递增，旧文件会被丢弃
+
+    def __init__(self, storage_path, index_path, on_updated=None):
+        self.storage_path = storage_path
+        self.index_path = index_path
+        self.on_updated = on_updated  # 在后台线程中调用: on_updated(有变化的文件名集合)
+        self.lock = threading.Lock()  # 保护索引数据，使查询看到一致的状态
+        self.files = {}  # {文件名: (mtime_ns, size, ...)}
+        self.ready = False  # 首次同步完成之前，索引可能不完整
+        self.pool = None
+        self.cond = threading.Condition()
+        self.tasks = deque()  # [('sync', None) | ('update', 文件名列表) | ('remove', 文件名列表)]
+        self._dirty = False
+        self._closed = False
+        self.thread = None
+
+    def start(self):
+        self.sync()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def sync(self):
+        """与工作目录对比修改时间和大小，重新索引变化的文件。"""
+        self._submit('sync', None)
+
+    def update(self, names):
+        self._submit('update', list(names))
+
+    def remove(self, names):
+        self._submit('remove', list(names))
+
+    def close(self, timeout=2.0):
+        """停止后台线程并把未保存的索引写回磁盘，最多等待 timeout 秒。"""
+        with self.cond:
+            self._closed = True
+            self.cond.notify()
+        if self.thread: self.thread.join(timeout)
+        if self.pool: self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def wanted(self, name):
+        """该文件是否需要索引。"""
+        return True
+
+    def _submit(self, kind, names):
+        with self.cond:
+            self.tasks.append((kind, names))
+            self.cond.notify()
+
+    def _get_pool(self):
+        if self.pool is None:
+            from concurrent.futures import ProcessPoolExecutor
+            self.pool = ProcessPoolExecutor()
+        return self.pool
 
+    # 后台线程
 
-BASE_PATH = get_base_path()
-STORAGE_DIR_NAME = "managed_programs"  # 用户代码的存放目录
-STORAGE_PATH = os.path.join(BASE_PATH, STORAGE_DIR_NAME)
+    def _run(self):
+        self._load()
+        while True:
+            with self.cond:
+                if not self.tasks and not self._closed:
+                    self.cond.wait(timeout=INDEX_SAVE_DELAY if self._dirty else None)
+                if self._closed:
+                    break
+                tasks, self.tasks = list(self.tasks), deque()
+            if not tasks:
+                self._save()  # 空闲了一段时间，写回磁盘
+                continue
+            changed = set()
+            for kind, names in tasks:
+                try:
+                    if kind == 'sync':
+                        changed.update(self._sync())
+                    elif kind == 'update':
+                        changed.update(self._index(names))
+                    else:
+                        names = [name for name in names if name in self.files]
+                        with self.lock:
+                            for name in names: self._forget(name)
+                        changed.update(names)
+                except OSError:
+                    pass
+            if changed:
+                self._dirty = True
+                self._compact()
+                if self.on_updated: self.on_updated(changed)
+        if self._dirty:
+            self._save()
+
+    def _load(self):
+        try:
+            with open(self.index_path, 'rb') as f:
+                data = pickle.load(f)
+            if data.get('storage_path') != os.path.abspath(self.storage_path): return
+            if data.get('version') != self.version: return
+            with self.lock:
+                self._restore(data)
+        except (OSError, EOFError, pickle.UnpicklingError, KeyError, AttributeError, TypeError, ValueError):
+            pass  # 没有或无法读取索引，从头建立
+
+    def _save(self):
+        with self.lock:
+            data = self._state()
+        data['storage_path'] = os.path.abspath(self.storage_path)
+        data['version'] = self.version
+        try:
+            _atomic_write(self.index_path, pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL))
+            self._dirty = False
+        except OSError:
+            pass
+
+    def _sync(self):
+        current = {}
+        with os.scandir(self.storage_path) as entries:
+            for entry in entries:
+                if entry.is_file() and self.wanted(entry.name):
+                    st = entry.stat()
+                    current[entry.name] = (st.st_mtime_ns, st.st_size)
+        changed = [name for name, stamp in current.items()
+                   if name not in self.files or self.files[name][:2] != stamp]
+        removed = [name for name in self.files if name not in current]
+        with self.lock:
+            for name in removed: self._forget(name)
+        changed = self._index(changed)
+        self.ready = True
+        return changed + removed
+
+    def _index(self, names):
+        names = [name for name in names if name and self.wanted(name)]
+        paths = [os.path.join(self.storage_path, name) for name in names]
+        if len(paths) >= INDEX_POOL_MIN_FILES:
+            batches = [paths[i:i + 64] for i in range(0, len(paths), 64)]
+            results = [r for batch in self._get_pool().map(self.worker, batches) for r in batch]
+        else:
+            results = self.worker(paths)
+        for name, result in zip(names, results):
+            if result is None:  # 文件已不存在
+                with self.lock: self._forget(name)
+            else:
+                self._store(name, result)
+        return names
+
+    @abc.abstractmethod
+    def _store(self, name, result):
+        """把 worker 对一个文件的结果存入索引（替换该文件原有的数据）。"""
+
+    @abc.abstractmethod
+    def _forget(self, name):
+        """从索引中删去一个文件（调用时已持有 lock）。"""
+
+    def _compact(self):
+        pass
+
+    @abc.abstractmethod
+    def _state(self):
+        """需要写回磁盘的数据（调用时已持有 lock）。"""
+
+    @abc.abstractmethod
+    def _restore(self, data):
+        """从 _state 写出的数据恢复索引。"""
+
+
+class SearchIndex(WorkspaceIndex):
+    """工作目录的三元组倒排索引。
+
+    每个文件有一个递增的编号，索引记录每个三元组出现在哪些文件中（按编号递增的数组）。文件更新时分配新编号，
+    旧编号只从有效编号中删去，查询时自然被过滤；失效编号多于有效文件时整体压缩一次。
+    没有建立索引的二进制文件无法排除，每次查询都作为候选；超过大文件阈值的文件每次都完整读取代价太高，不参与搜索。
+    """
+
+    worker = staticmethod(_index_files)
+    version = 2
+
+    def __init__(self, storage_path, index_path, on_updated=None):
+        super().__init__(storage_path, index_path, on_updated)
+        # self.files: {文件名: (mtime_ns, size, 编号)}
+        self.names = {}  # {有效编号: 文件名}
+        self.postings = {}  # {三元组: array('I', 文件编号)}
+        self.unindexed = set()  # 没有建立索引的文件编号
+        self.next_id = 0
+
+    def _store(self, name, result):
+        mtime_ns, size, trigrams = result
+        with self.lock:
+            self._forget(name)
+            file_id = self.next_id
+            self.next_id += 1
+            self.files[name] = (mtime_ns, size, file_id)
+            self.names[file_id] = name
+            if trigrams is None:
+                self.unindexed.add(file_id)
+                return
+        postings = self.postings
+        for i in range(0, len(trigrams), 3):
+            trigram = trigrams[i:i + 3]
+            ids = postings.get(trigram)
+            if ids is None:
+                postings[trigram] = array('I', (file_id,))
+            else:
+                ids.append(file_id)
+
+    def _forget(self, name):
+        entry = self.files.pop(name, None)
+        if entry:
+            del self.names[entry[2]]
+            self.unindexed.discard(entry[2])
+
+    def _compact(self):
+        """失效编号多于有效文件时，重建不含失效编号的倒排表。"""
+        dead = self.next_id - len(self.names)
+        if dead < max(1000, len(self.names)): return
+        remap = {old: new for new, old in enumerate(sorted(self.names))}  # 同时重新编号，让编号保持紧凑
+        postings = {}
+        for trigram, ids in self.postings.items():
+            kept = array('I', (remap[i] for i in ids if i in remap))
+            if kept: postings[trigram] = kept
+        with self.lock:
+            self.files = {name: e[:2] + (remap[e[2]],) for name, e in self.files.items()}
+            self.names = {remap[i]: name for i, name in self.names.items()}
+            self.unindexed = {remap[i] for i in self.unindexed}
+            self.next_id = len(remap)
+            self.postings = postings
+
+    def _state(self):
+        return {'files': dict(self.files), 'postings': self.postings, 'unindexed': set(self.unindexed),
+                'next_id': self.next_id}
+
+    def _restore(self, data):
+        self.files, self.postings, self.next_id = data['files'], data['postings'], data['next_id']
+        self.unindexed = data['unindexed']
+        self.names = {entry[2]: name for name, entry in self.files.items()}
+
+    # 查询（在搜索线程中调用）
+
+    def candidates(self, fragments):
+        """返回 (可能同时包含所有片段的文件名, 因超过大文件阈值而跳过的文件名)。
+
+        没有能用来缩小范围的三元组或索引尚未就绪时，除大文件以外的全部文件都是候选。
+        """
+        trigrams = set()
+        for fragment in fragments:
+            trigrams |= _trigrams(fragment)
+        if not self.ready:
+            names, skipped = [], []
+            with os.scandir(self.storage_path) as entries:
+                for entry in entries:
+                    if not entry.is_file(): continue
+                    try:
+                        large = entry.stat().st_size > LARGE_FILE_THRESHOLD
+                    except OSError:
+                        continue
+                    (skipped if large else names).append(entry.name)
+            return sorted(names), sorted(skipped)
+        with self.lock:
+            names = dict(self.names)
+            postings = self.postings
+            large = {i for i in self.unindexed if self.files[names[i]][1] > LARGE_FILE_THRESHOLD}
+            unindexed = self.unindexed - large
+        skipped = sorted(names.pop(i) for i in large)
+        if not trigrams:
+            return sorted(names.values()), skipped
+        lists = sorted((postings.get(trigram, ()) for trigram in trigrams), key=len)
+        ids = set(lists[0])
+        for other in lists[1:]:
+            if not ids: break
+            ids.intersection_update(other)
+        return sorted(names[i] for i in ids | unindexed if i in names), skipped
+
+    def search(self, query, is_regex, ignore_case, limit=SEARCH_MAX_RESULTS):
+        """返回 ([(文件名, 匹配列表)], 候选文件数, 跳过的大文件数)。正则表达式有误时抛出 re.error。"""
+        flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+        if is_regex:
+            re.compile(query, flags)
+            pattern, fragments = query, _regex_literals(query)
+        else:
+            pattern, fragments = re.escape(query), [query]
+        names, skipped = self.candidates(fragments)
+        if len(names) < INDEX_POOL_MIN_FILES:
+            return _search_files(self.storage_path, names, pattern, flags, limit), len(names), len(skipped)
+        pool = self._get_pool()
+        step = max(1, len(names) // ((os.cpu_count() or 1) * 4))
+        futures = [pool.submit(_search_files, self.storage_path, names[i:i + step], pattern, flags, limit)
+                   for i in range(0, len(names), step)]
+        results, total = [], 0
+        for future in futures:
+            for name, matches in future.result():
+                if total >= limit: break
+                matches = matches[:limit - total]
+                results.append((name, matches))
+                total += len(matches)
+        for future in futures: future.cancel()
+        return results, len(names), len(skipped)
+
+
+class FindInFilesWindow(Toplevel):
+    """“在文件中查找”窗口：边输入边搜索，点击结果时调用 on_open(文件名, 行, 列, 结束行, 结束列)。"""
+
+    def __init__(self, master, index, on_open):
+        super().__init__(master)
+        self.title("在文件中查找")
+        self.geometry("700x450")
+        self.index = index
+        self.on_open = on_open
+        self.generation = 0
+        self._job = None
+        self.results = []  # 与列表框中的行一一对应: (文件名, 行, 列, 结束行, 结束列)
+
+        bar = Frame(self, padx=5, pady=5)
+        bar.pack(fill="x")
+        self.query_var = tk.StringVar()
+        entry = tk.Entry(bar, textvariable=self.query_var)
+        entry.pack(side="left", fill="x", expand=True)
+        self.regex_var = tk.BooleanVar(value=False)
+        self.ignore_case_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(bar, text="正则", variable=self.regex_var, command=self._schedule).pack(side="left")
+        tk.Checkbutton(bar, text="忽略大小写", variable=self.ignore_case_var, command=self._schedule).pack(side="left")
+        self.status = Label(self, anchor="w", padx=5)
+        self.status.pack(fill="x")
+        body = Frame(self)
+        body.pack(fill="both", expand=True)
+        scrollbar = Scrollbar(body)
+        scrollbar.pack(side="right", fill="y")
+        self.listbox = tk.Listbox(body, font=("Consolas", 10), activestyle="none", yscrollcommand=scrollbar.set)
+        self.listbox.pack(side="left", fill="both", expand=True)
+        scrollbar.config(command=self.listbox.yview)
+
+        self.query_var.trace_add("write", lambda *args: self._schedule())
+        self.listbox.bind("<<ListboxSelect>>", self._on_select)
+        entry.bind("<Return>", lambda e: self._run_query())
+        entry.focus_set()
+
+    def _schedule(self):
+        if self._job: self.after_cancel(self._job)
+        self._job = self.after(SEARCH_DELAY_MS, self._run_query)
+
+    def _run_query(self):
+        self._job = None
+        self.generation += 1  # 之前尚未返回的搜索结果会被丢弃
+        query = self.query_var.get()
+        if not query:
+            self._show(self.generation, ([], 0), 0.0)
+            return
+        job = (self.generation, query, self.regex_var.get(), self.ignore_case_var.get())
+        threading.Thread(target=self._search, args=job, daemon=True).start()
+
+    def _search(self, generation, query, is_regex, ignore_case):
+        started = time.perf_counter()
+        try:
+            result = self.index.search(query, is_regex, ignore_case)
+        except re.error as e:
+            result = e
+        try:
+            self.after(0, self._show, generation, result, time.perf_counter() - started)
+        except (RuntimeError, tk.TclError):
+            pass  # 窗口已经关闭
+
+    def _show(self, generation, result, elapsed):
+        if generation != self.generation: return
+        self.listbox.delete(0, END)
+        self.results = []
+        if isinstance(result, re.error):
+            self.status.config(text=f"正则表达式有误: {result}")
+            return
+        files, candidates, skipped = result
+        lines = []
+        for name, matches in files:
+            for line, col, end_line, end_col, preview in matches:
+                lines.append(f"{name}:{line}: {preview.strip()}")
+                self.results.append((name, line, col, end_line, end_col))
+        if lines:
+            self.listbox.insert(END, *lines)
+        capped = "（已达上限）" if len(self.results) >= SEARCH_MAX_RESULTS else ""
+        large = f"，跳过 {skipped} 个大文件（超过 {LARGE_FILE_THRESHOLD // (1024 * 1024)} MB）" if skipped else ""
+        self.status.config(text=f"{len(self.results)} 个匹配{capped}，{len(files)} 个文件，"
+                                f"索引筛出 {candidates} 个候选{large}，用时 {elapsed * 1000:.0f} ms")
+
+    def _on_select(self, event=None):
+        selection = self.listbox.curselection()
+        if selection:
+            self.on_open(*self.results[selection[0]])
+
+
+# --- 符号索引 ---
+
+def _target_names(target):
+    """赋值目标中真正被绑定的名称：只沿元组、列表和星号展开，a.b = ... 和 a[k] = ... 并不定义 a 或 k。"""
+    import ast
+    if isinstance(target, ast.Name):
+        yield target
+    elif isinstance(target, (ast.Tuple, ast.List)):
+        for element in target.elts:
+            yield from _target_names(element)
+    elif isinstance(target, ast.Starred):
+        yield from _target_names(target.value)
+
+
+def _collect_symbols(body, container, symbols, scope='module'):
+    """收集语句列表中的定义。scope 为 'module'、'class' 或 'function'；
+    函数体内只收集嵌套的类和函数，局部变量和局部导入不进索引。
+    """
+    import ast
+    for node in body:
+        if isinstance(node, ast.ClassDef):
+            symbols.append((node.name, 'class', node.lineno, node.col_offset + len('class '), container))
+            inner = f"{container}.{node.name}" if container else node.name
+            _collect_symbols(node.body, inner, symbols, 'class')
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            kind = 'method' if scope == 'class' else 'function'
+            # 列号指向函数名而不是 def 关键字
+            col = node.col_offset + (len('async def ') if isinstance(node, ast.AsyncFunctionDef) else len('def '))
+            symbols.append((node.name, kind, node.lineno, col, container))
+            inner = f"{container}.{node.name}" if container else node.name
+            _collect_symbols(node.body, inner, symbols, 'function')
+        elif scope == 'function':
+            continue
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                if alias.name == '*': continue
+                name = alias.asname or alias.name.split('.')[0]
+                symbols.append((name, 'import', node.lineno, node.col_offset, container))
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):  # x += 1 修改已有的名称，不算定义
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            for target in targets:
+                for name_node in _target_names(target):
+                    symbols.append((name_node.id, 'variable', name_node.lineno, name_node.col_offset, container))
+        elif isinstance(node, (ast.If, ast.Try, ast.With, ast.For, ast.While)):
+            # 模块或类顶层的条件定义（如 try: import ... except ImportError）也算
+            for field in ('body', 'orelse', 'finalbody'):
+                _collect_symbols(getattr(node, field, []), container, symbols, scope)
+            for handler in getattr(node, 'handlers', []):
+                _collect_symbols(handler.body, container, symbols, scope)
+
+
+def _parse_symbols(paths):
+    """在进程池中运行：返回每个文件的 (mtime_ns, size, 符号列表)，不可读的文件为None。
+
+    符号为 (名称, 类型, 行, 列, 所在的类或函数)，行号从1开始。文件有语法错误时符号列表为None，保留上次的结果。
+    """
+    import ast
+    results = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            symbols = []
+            if st.st_size <= LARGE_FILE_THRESHOLD:
+                with open(path, 'rb') as f:
+                    source = f.read()
+                try:
+                    _collect_symbols(ast.parse(source, path).body, '', symbols)
+                except (SyntaxError, ValueError, RecursionError):
+                    symbols = None
+            results.append((st.st_mtime_ns, st.st_size, symbols))
+        except OSError:
+            results.append(None)
+    return results
+
+
+class SymbolIndex(WorkspaceIndex):
+    """工作目录中所有 .py 文件的符号索引：按文件保存大纲，按名称保存定义位置，查找定义只是一次字典访问。"""
+
+    worker = staticmethod(_parse_symbols)
+    version = 2
+
+    def __init__(self, storage_path, index_path, on_updated=None):
+        super().__init__(storage_path, index_path, on_updated)
+        # self.files: {文件名: (mtime_ns, size)}
+        self.symbols = {}  # {文件名: [(名称, 类型, 行, 列, 所在的类或函数)]}
+        self.definitions = {}  # {名称: {文件名: [符号]}}
+
+    def wanted(self, name):
+        return name.endswith('.py')
+
+    def outline(self, filename):
+        """文件中的符号，按出现顺序排列。"""
+        with self.lock:
+            return list(self.symbols.get(filename, ()))
+
+    def lookup(self, name):
+        """名称的所有定义 [(文件名, 符号)]。"""
+        with self.lock:
+            by_file = self.definitions.get(name, {})
+            return [(filename, symbol) for filename, symbols in by_file.items() for symbol in symbols]
+
+    def search(self, query, limit=SYMBOL_MAX_RESULTS):
+        """名称中包含 query（忽略大小写）的定义 [(文件名, 符号)]，以 query 开头的排在前面，不包括导入。"""
+        query = query.lower()
+        with self.lock:
+            names = [name for name in self.definitions if query in name.lower()]
+            names.sort(key=lambda name: (not name.lower().startswith(query), len(name), name))
+            results = []
+            for name in names:
+                for filename, symbols in self.definitions[name].items():
+                    results.extend((filename, s) for s in symbols if s[1] != 'import')
+                if len(results) >= limit: break
+        return results[:limit]
+
+    def _store(self, name, result):
+        mtime_ns, size, symbols = result
+        with self.lock:
+            if symbols is None:  # 语法错误：保留上次成功解析的符号
+                symbols = self.symbols.get(name, [])
+            self._forget(name)
+            self._add(name, (mtime_ns, size), symbols)
+
+    def _add(self, name, stamp, symbols):
+        self.files[name] = stamp
+        self.symbols[name] = symbols
+        for symbol in symbols:
+            self.definitions.setdefault(symbol[0], {}).setdefault(name, []).append(symbol)
+
+    def _forget(self, name):
+        self.files.pop(name, None)
+        for symbol in self.symbols.pop(name, ()):
+            by_file = self.definitions.get(symbol[0])
+            if by_file and by_file.pop(name, None) is not None and not by_file:
+                del self.definitions[symbol[0]]
+
+    def _state(self):
+        return {'files': dict(self.files), 'symbols': dict(self.symbols)}
+
+    def _restore(self, data):
+        for name, stamp in data['files'].items():
+            self._add(name, stamp, data['symbols'][name])
+
+
+class SymbolSearchWindow(Toplevel):
+    """“转到符号”窗口：按名称搜索整个工作目录的定义，点击结果时调用 on_open(文件名, 符号)。"""
+
+    def __init__(self, master, index, on_open, query=""):
+        super().__init__(master)
+        self.title("转到符号")
+        self.geometry("600x400")
+        self.index = index
+        self.on_open = on_open
+        self.results = []
+
+        self.query_var = tk.StringVar(value=query)
+        entry = tk.Entry(self, textvariable=self.query_var)
+        entry.pack(fill="x", padx=5, pady=5)
+        body = Frame(self)
+        body.pack(fill="both", expand=True)
+        scrollbar = Scrollbar(body)
+        scrollbar.pack(side="right", fill="y")
+        self.listbox = tk.Listbox(body, font=("Consolas", 10), activestyle="none", yscrollcommand=scrollbar.set)
+        self.listbox.pack(side="left", fill="both", expand=True)
+        scrollbar.config(command=self.listbox.yview)
+
+        self.query_var.trace_add("write", lambda *args: self.refresh())
+        self.listbox.bind("<<ListboxSelect>>", self._on_select)
+        entry.bind("<Return>", lambda e: self._open_first())
+        entry.focus_set()
+        entry.icursor(END)
+        self.refresh()
+
+    def set_query(self, query):
+        self.query_var.set(query)
+
+    def refresh(self):
+        """符号都在内存里，直接在UI线程中查询。"""
+        query = self.query_var.get().strip()
+        self.results = self.index.search(query) if query else []
+        self.listbox.delete(0, END)
+        lines = [f"{SYMBOL_KIND_LABELS[s[1]]} {s[4] + '.' if s[4] else ''}{s[0]}    {filename}:{s[2]}"
+                 for filename, s in self.results]
+        if lines:
+            self.listbox.insert(END, *lines)
+
+    def _on_select(self, event=None):
+        selection = self.listbox.curselection()
+        if selection:
+            self.on_open(*self.results[selection[0]])
+
+    def _open_first(self):
+        if self.results:
+            self.on_open(*self.results[0])
+
+
+# --- 启动耗时统计 ---
+
+class StartupProfiler:
+    """记录启动各阶段的时间点。用 --profile-startup 启动时，在后台预导入完成后把各阶段耗时打印到终端。"""
+
+    def __init__(self):
+        self.enabled = False
+        self.marks = []  # [(阶段名, perf_counter时间点)]
+
+    def mark(self, name):
+        if self.enabled:
+            self.marks.append((name, time.perf_counter()))
+
+    def report(self):
+        if not self.enabled: return
+        print("启动耗时（毫秒）        本阶段    累计", file=sys.stderr)
+        previous = _STARTUP_T0
+        for name, moment in self.marks:
+            print(f"  {name:<20}{(moment - previous) * 1000:8.1f}{(moment - _STARTUP_T0) * 1000:8.1f}",
+                  file=sys.stderr)
+            previous = moment
+
+
+startup_profiler = StartupProfiler()
+
+
+# --- 性能监视 ---
+
+def _percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class PerfMonitor:
+    """可选的性能监视：记录热点函数的耗时、按键到空闲的延迟、每帧的Tcl调用数和事件积压。
+
+    关闭时被包装的函数只多一次属性判断。数据可以导出为JSON或Chrome trace（chrome://tracing、Perfetto）。
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.root = None
+        self.samples = {}  # {指标名: deque[毫秒]}
+        self.trace = deque(maxlen=PERF_TRACE_LIMIT)  # [(名称, 开始时间, 耗时, 线程id, 参数)]，时间单位为秒
+        self._frame_job = None
+        self._last_frame = None  # (perf_counter时间点, Tcl命令计数)
+
+    def attach(self, root):
+        self.root = root
+
+    def wrap(self, obj, name, idle_probe=False):
+        """用计时包装 obj 上的方法。必须在方法被绑定为回调之前调用。idle_probe 时还会测量调用到界面空闲的延迟。"""
+        func = getattr(obj, name)
+        monitor = self
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not monitor.enabled:
+                return func(*args, **kwargs)
+            tcl_before = monitor.tcl_command_count()
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                monitor.record(name, started, time.perf_counter(),
+                               {'tcl_calls': monitor.tcl_command_count() - tcl_before - 1})
+                if idle_probe:
+                    monitor.root.after_idle(monitor._idle_probe, name + "→空闲", started)
+
+        setattr(obj, name, wrapper)
+
+    def record(self, name, started, finished, args=None):
+        """记录一个样本，可以在任意线程调用。"""
+        if not self.enabled: return
+        samples = self.samples.get(name)
+        if samples is None:
+            samples = self.samples.setdefault(name, deque(maxlen=PERF_SAMPLE_LIMIT))
+        samples.append((finished - started) * 1000)
+        self.trace.append((name, started, finished - started, threading.get_ident(), args or {}))
+
+    def _idle_probe(self, name, started):
+        self.record(name, started, time.perf_counter())
+
+    def tcl_command_count(self):
+        """Tcl解释器至今执行过的命令总数（info cmdcount），用差值统计Tcl调用次数。"""
+        return int(self.root.tk.call('info', 'cmdcount'))
+
+    def backlog(self):
+        """尚未执行的 after/after_idle 回调数。"""
+        return len(self.root.tk.splitlist(self.root.tk.call('after', 'info')))
+
+    def start(self):
+        self.enabled = True
+        self._last_frame = None
+        if self._frame_job is None:
+            self._frame_tick()
+
+    def stop(self):
+        self.enabled = False
+        if self._frame_job:
+            self.root.after_cancel(self._frame_job)
+            self._frame_job = None
+
+    def _frame_tick(self):
+        """每帧记录一次：这段时间内的Tcl命令数，以及定时器比预期晚了多少（反映事件循环的积压）。"""
+        now, count = time.perf_counter(), self.tcl_command_count()
+        if self._last_frame:
+            last_time, last_count = self._last_frame
+            self.samples.setdefault("Tcl调用/帧", deque(maxlen=PERF_SAMPLE_LIMIT)).append(count - last_count)
+            self.samples.setdefault("帧延迟", deque(maxlen=PERF_SAMPLE_LIMIT)).append(
+                max(0.0, (now - last_time) * 1000 - PERF_FRAME_MS))
+            self.trace.append(("Tcl调用/帧", now, None, threading.get_ident(), {'count': count - last_count}))
+        self._last_frame = (now, count + 1)
+        self._frame_job = self.root.after(PERF_FRAME_MS, self._frame_tick)
+
+    def summary(self):
+        """{指标名: {'count', 'p50', 'p99', 'max'}}"""
+        result = {}
+        for name, samples in list(self.samples.items()):
+            values = sorted(samples)
+            if values:
+                result[name] = {'count': len(values), 'p50': _percentile(values, 0.5),
+                                'p99': _percentile(values, 0.99), 'max': values[-1]}
+        return result
+
+    def hud_text(self):
+        lines = [f"{'指标':<16}{'次数':>6}{'p50':>8}{'p99':>8}"]
+        for name, stats in sorted(self.summary().items()):
+            lines.append(f"{name:<16}{stats['count']:>6}{stats['p50']:>8.1f}{stats['p99']:>8.1f}")
+        lines.append(f"事件积压 {self.backlog()}")
+        return "\n".join(lines)
+
+    def export_json(self, path):
+        data = {'summary': self.summary(), 'samples': {name: list(s) for name, s in list(self.samples.items())}}
+        _atomic_write(path, json.dumps(data, ensure_ascii=False, indent=1).encode('utf-8'))
+
+    def export_chrome_trace(self, path):
+        """导出为 Chrome Trace Event 格式：函数耗时为完整事件（ph=X），每帧Tcl调用数为计数器（ph=C）。"""
+        pid = os.getpid()
+        events = []
+        for name, started, duration, tid, args in list(self.trace):
+            if duration is None:
+                events.append({'name': name, 'ph': 'C', 'ts': started * 1e6, 'pid': pid, 'args': args})
+            else:
+                events.append({'name': name, 'ph': 'X', 'ts': started * 1e6, 'dur': duration * 1e6,
+                               'pid': pid, 'tid': tid, 'args': args})
+        _atomic_write(path, json.dumps({'traceEvents': events}, ensure_ascii=False).encode('utf-8'))
+
+
+perf_monitor = PerfMonitor()
 
 
 class FunkyIDE:
-    def __init__(self, root):
+    def __init__(self, root, storage_path=STORAGE_PATH, journal_path=JOURNAL_PATH, session_path=SESSION_PATH,
+                 highlight_cache_path=HIGHLIGHT_CACHE_PATH):
         self.root = root
         self.root.title(f"FunkyIDE v8.0 - 律动之心")
         self.root.geometry("1000x750")
 
-        self.storage_path = STORAGE_PATH
+        self.storage_path = storage_path
+        self.journal_path = journal_path
+        self.session_path = session_path
         self.ensure_storage_dir_exists()
 
         # --- 编辑器核心状态 ---
-        self.open_files = {}  # {filename: {'content': str, 'tab': Frame, 'is_dirty': bool}}
+        # 标签页的组件由 TabStrip 管理，这里只保存编辑区及其状态:
+        # {filename: {'text': Text, 'highlighter': IncrementalHighlighter, 'is_dirty': bool,
+        #             'lexer': Lexer|None, 'lexer_override': str|None, 'large': LargeFileView|None,
+        #             'lazy': 会话中恢复、尚未载入内容的标签页的光标和滚动位置|None,
+        #             'highlight_key': 等待写入高亮缓存的 (缓存键, 内容版本)|None}}
+        self.open_files = {}
         self.current_file = None
         self._highlight_job = None  # 用于延迟执行语法高亮，避免卡顿
+        self.typing_fx = TypingFadeEngine(self.root)
+        self.warm_pool = None  # “快速运行”模式的预热进程池，开启该模式时才创建
+        self.run_manager = RunManager(self.read_pipe)
+        self.md_renderer = None  # 第一次实时预览时创建，届时才导入 markdown
+        self.live_preview = None  # Markdown 实时预览服务器，第一次预览时才启动
+        self._live_preview_job = None
+        self._export_running = False
+        self.writer = BackgroundWriter(self.root)
+        self.pending_saves = 0  # 已提交但尚未写完的保存
+        self._journal_written = False  # 恢复日志中是否有内容
+        self.highlight_cache = HighlightCache(highlight_cache_path)
 
+        self.highlight_tag_options = {}  # 语法高亮的tag样式，窗口显示后才计算，见 init_syntax_highlighting
+        self._instrument()
         self.create_widgets()
-        self.init_syntax_highlighting()
         self.bind_events()
 
-        self.update_file_list()
+        # 文件列表由后台线程扫描并持续跟踪目录变化，窗口显示后才开始
+        self.file_watcher = DirectoryWatcher(self.root, self.storage_path, self.on_files_changed)
+        index_dir = os.path.dirname(os.path.abspath(self.storage_path))
+        self.search_index = SearchIndex(self.storage_path, os.path.join(index_dir, SEARCH_INDEX_NAME))
+        self.symbol_index = SymbolIndex(self.storage_path, os.path.join(index_dir, SYMBOL_INDEX_NAME),
+                                        on_updated=self._on_symbols_updated)
+        self.find_window = None
+        self.symbol_window = None
+        self.outline_symbols = []  # 与大纲列表中的行一一对应
         self.update_title()
+        self.root.bind("<Map>", self._on_first_map)
+        if os.environ.get(PERF_ENV_VAR):
+            self.perf_var.set(True)
+            self.on_perf_toggled()
+        self.root.after(AUTOSAVE_INTERVAL_MS, self.autosave_journal)
+
+    def _instrument(self):
+        """给热点函数装上性能监视的计时包装，监视关闭时几乎没有开销。"""
+        perf_monitor.attach(self.root)
+        for name in ('apply_syntax_highlighting', 'switch_to_tab', 'update_output_text',
+                     'update_file_list', 'on_files_changed', 'save_file'):
+            perf_monitor.wrap(self, name)
+        perf_monitor.wrap(self, 'on_key_press_effect', idle_probe=True)
+        self._perf_hud = None
+        self._perf_hud_job = None
+
+    def _on_first_map(self, event):
+        """窗口第一次显示时触发，把不影响首帧的初始化推迟到首帧绘制之后。"""
+        if event.widget is not self.root: return  # 子组件的 <Map> 事件也会传到这里
+        self.root.unbind("<Map>")
+        startup_profiler.mark("窗口首次显示")
+        self.root.after_idle(self._deferred_init)
+
+    def _deferred_init(self):
+        self.init_syntax_highlighting()
+        startup_profiler.mark("配置语法高亮tag")
+        self.file_watcher.start()
+        self.search_index.start()
+        self.symbol_index.start()
+        startup_profiler.mark("启动文件列表扫描")
+        threading.Thread(target=self._preload_modules, daemon=True).start()
+        self.restore_session()
+        self.restore_journal()
+
+    def _preload_modules(self):
+        """在后台提前导入打开文件和预览时才用到的模块，第一次打开文件时就不必等待导入。"""
+        from pygments.lexers import get_lexer_by_name
+        import markdown
+        get_lexer_by_name('python')
+        startup_profiler.mark("后台预导入 pygments/markdown")
+        startup_profiler.report()
 
     def create_widgets(self):
         """构建整个IDE的UI界面。"""
+        # 菜单栏：手动指定当前文件的语言
+        menubar = tk.Menu(self.root)
+        self.language_var = tk.StringVar(value="auto")
+        language_menu = tk.Menu(menubar, tearoff=0)
+        language_menu.add_radiobutton(label="自动检测", variable=self.language_var, value="auto",
+                                      command=self.on_language_selected)
+        language_menu.add_separator()
+        for label, alias in LANGUAGE_CHOICES:
+            language_menu.add_radiobutton(label=label, variable=self.language_var, value=alias,
+                                          command=self.on_language_selected)
+        menubar.add_cascade(label="语言", menu=language_menu)
+        run_menu = tk.Menu(menubar, tearoff=0)
+        run_menu.add_command(label="停止全部运行", command=lambda: self.run_manager.stop_all())
+        run_menu.add_command(label="强制结束全部运行", command=lambda: self.run_manager.stop_all(kill=True))
+        menubar.add_cascade(label="运行", menu=run_menu)
+        preview_menu = tk.Menu(menubar, tearoff=0)
+        self.live_preview_var = tk.BooleanVar(value=False)
+        preview_menu.add_checkbutton(label="Markdown 实时预览", variable=self.live_preview_var,
+                                     command=self.on_live_preview_toggled)
+        preview_menu.add_command(label="在浏览器中打开预览页面", command=self.open_live_preview_page)
+        preview_menu.add_separator()
+        preview_menu.add_command(label="批量导出Markdown为HTML", command=self.export_markdown)
+        menubar.add_cascade(label="预览", menu=preview_menu)
+        search_menu = tk.Menu(menubar, tearoff=0)
+        search_menu.add_command(label="在文件中查找...", accelerator="Ctrl+Shift+F", command=self.show_find_in_files)
+        search_menu.add_command(label="转到符号...", accelerator="Ctrl+T", command=self.show_symbol_search)
+        search_menu.add_command(label="转到定义", accelerator="F12", command=self.go_to_definition)
+        search_menu.add_separator()
+        search_menu.add_command(label="重新同步索引", command=self.resync_indexes)
+        menubar.add_cascade(label="搜索", menu=search_menu)
+        perf_menu = tk.Menu(menubar, tearoff=0)
+        self.perf_var = tk.BooleanVar(value=False)
+        perf_menu.add_checkbutton(label="性能监视浮窗", variable=self.perf_var, command=self.on_perf_toggled)
+        perf_menu.add_command(label="导出为JSON...", command=lambda: self.export_perf("json"))
+        perf_menu.add_command(label="导出为Chrome trace...", command=lambda: self.export_perf("trace"))
+        menubar.add_cascade(label="性能", menu=perf_menu)
+        self.root.config(menu=menubar)
+
         # 主布局：左侧文件列表，右侧编辑区
         left_panel = Frame(self.root, width=250, padx=10, pady=10)
         left_panel.pack(side="left", fill="y")
@@ -66,14 +3200,24 @@ class FunkyIDE:
         right_panel.pack(side="right", fill="both", expand=True)
 
         # 左侧文件列表
-        tk.Label(left_panel, text="程序文件列表").pack(pady=(0, 5))
-        list_frame = Frame(left_panel)
-        list_frame.pack(fill="both", expand=True)
-        self.file_listbox = Listbox(list_frame, height=25)
-        self.file_listbox.pack(side="left", fill="both", expand=True)
-        scrollbar = Scrollbar(list_frame, orient="vertical", command=self.file_listbox.yview)
-        scrollbar.pack(side="right", fill="y")
-        self.file_listbox.config(yscrollcommand=scrollbar.set)
+        list_header = Frame(left_panel)
+        list_header.pack(fill="x", pady=(0, 5))
+        tk.Label(list_header, text="程序文件列表").pack(side="left")
+        Button(list_header, text="刷新", command=self.update_file_list, relief="flat").pack(side="right")
+        self.file_list = VirtualFileList(left_panel, on_open=self.open_file)
+        self.file_list.pack(fill="both", expand=True)
+
+        # 左下：当前文件的大纲
+        tk.Label(left_panel, text="大纲").pack(anchor="w", pady=(10, 5))
+        outline_frame = Frame(left_panel)
+        outline_frame.pack(fill="both")
+        outline_scrollbar = Scrollbar(outline_frame)
+        outline_scrollbar.pack(side="right", fill="y")
+        self.outline_list = tk.Listbox(outline_frame, height=12, activestyle="none",
+                                       yscrollcommand=outline_scrollbar.set)
+        self.outline_list.pack(side="left", fill="both", expand=True)
+        outline_scrollbar.config(command=self.outline_list.yview)
+        self.outline_list.bind("<<ListboxSelect>>", self.on_outline_select)
 
         # 右侧：按钮栏 + 标签栏 + 编辑区
         button_bar = Frame(right_panel)
@@ -85,26 +3229,53 @@ class FunkyIDE:
         run_button = Button(button_bar, text="▶ 运行/预览", command=self.run_or_preview, bg="#4CAF50", fg="white",
                             font=("Arial", 9, "bold"))
         run_button.pack(side="right", padx=10)
+        self.fast_run_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(button_bar, text="⚡快速运行", variable=self.fast_run_var,
+                       command=self.on_fast_run_toggled).pack(side="right")
 
-        # 标签栏容器，这是实现“弹跳”效果的关键区域
-        self.tab_container = Frame(right_panel, height=35, bg="#3c4043")
-        self.tab_container.pack(fill="x", side="top")
-        self.tab_container.pack_propagate(False)  # 固定高度，不让子组件撑开
+        # 标签栏，这是实现“弹跳”效果的关键区域
+        self.tab_strip = TabStrip(right_panel, on_select=self.switch_to_tab, on_close=self.close_tab,
+                                  on_enter=self.on_tab_enter, on_leave=self.on_tab_leave)
+        self.tab_strip.pack(fill="x", side="top")
 
-        # 主文本编辑区
-        self.text_area = Text(right_panel, wrap="word", font=("Consolas", 12), undo=True,
-                              bg="#282c34", fg="#abb2bf", insertbackground="white")
+        # 主文本编辑区：每个标签页都有自己的Text组件，这里只是它们的容器
+        self.editor_frame = Frame(right_panel)
+        self.editor_frame.pack(fill="both", expand=True)
+        # 没有打开任何文件时显示的空白编辑区
+        self.blank_text, self.blank_highlighter = self._create_editor()
+        self.text_area, self.highlighter = self.blank_text, self.blank_highlighter
         self.text_area.pack(fill="both", expand=True)
-        self.text_area.edit_modified(False)
+
+    def _create_editor(self):
+        """创建一个编辑区组件及其高亮器。标签页的内容、tag、撤销栈和滚动位置都保存在各自的组件中。"""
+        text = Text(self.editor_frame, wrap="word", font=("Consolas", 12), undo=True,
+                    bg="#282c34", fg="#abb2bf", insertbackground="white")
+        for tag_name, kwargs in self.highlight_tag_options.items():
+            text.tag_configure(tag_name, **kwargs)
+        text.tag_configure("typing_effect", foreground="#00FFFF")  # 打字特效颜色
+        text.bind("<KeyPress>", self.on_key_press_effect)
+        text.bind("<KeyRelease>", self.schedule_syntax_highlight)
+        text.bind("<KeyRelease>", self.schedule_live_preview, add="+")
+        text.bind("<<Modified>>", self.on_text_modified)
+        text.bind("<<Paste>>", lambda e: self.typing_fx.pause(TYPING_EFFECT_PASTE_PAUSE_MS))
+        text.bind("<F12>", lambda e: self.go_to_definition())
+        text.bind("<Control-t>", lambda e: self.show_symbol_search() or "break")  # 覆盖Text默认的交换字符
+        text.bind("<Control-Button-1>", lambda e: self.go_to_definition(f"@{e.x},{e.y}"))
+        text.edit_modified(False)
+        return text, IncrementalHighlighter(text, self.highlight_tag_options)
+
+    def _show_editor(self, text_widget):
+        """换上另一个编辑区组件，只涉及两次 pack 操作，与文件大小无关。"""
+        if text_widget is self.text_area: return
+        self.text_area.pack_forget()
+        text_widget.pack(fill="both", expand=True)
+        self.text_area = text_widget
 
     def bind_events(self):
-        """集中绑定所有事件。"""
-        self.file_listbox.bind("<Double-1>", self.on_file_double_click)
-        self.text_area.tag_configure("typing_effect", foreground="#00FFFF")  # 打字特效颜色
-        self.text_area.bind("<KeyPress>", self.on_key_press_effect)
-        self.text_area.bind("<KeyRelease>", self.schedule_syntax_highlight)
-        self.text_area.bind("<<Modified>>", self.on_text_modified)
+        """集中绑定所有事件。编辑区的事件在 _create_editor 中逐个绑定。"""
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
+        self.root.bind("<Control-Shift-F>", lambda e: self.show_find_in_files())
+        self.root.bind("<Control-t>", lambda e: self.show_symbol_search())
 
     # --- 特效与交互 ---
 
@@ -112,7 +3283,7 @@ class FunkyIDE:
         """鼠标进入标签：执行弹跳动画。"""
         tab_frame = event.widget
         # 仅当标签未被选中时才触发动画，避免视觉干扰
-        if tab_frame.cget("bg") != "#5f6368":
+        if tab_frame.cget("bg") != TAB_ACTIVE_BG:
             tab_frame.place_configure(relheight=1.1, y=-2)
 
     def on_tab_leave(self, event):
@@ -129,30 +3300,38 @@ class FunkyIDE:
         if event.state & 0x4 or event.keysym in ignore_keys:
             return
 
+        # 大文件、只读的大文件模式或粘贴期间关闭特效，交给默认的字符插入
+        if self.typing_fx.is_paused() or len(self.highlighter.states) > TYPING_EFFECT_MAX_LINES:
+            return
+        if str(self.text_area.cget("state")) == "disabled":
+            return
+
         # 只处理可打印字符
         if len(event.char) == 1 and event.char.isprintable():
             insert_index = self.text_area.index(tk.INSERT)
-            # 插入带特效tag的字符，并安排一个定时任务来移除特效
+            # 插入带特效tag的字符，由统一的淡出调度器稍后移除特效
             self.text_area.insert(insert_index, event.char, ("typing_effect",))
-            self.root.after(400, lambda: self.fade_character_color(insert_index))
+            self.typing_fx.add(self.text_area, insert_index)
             return 'break'  # 阻止默认的字符插入，避免重复
 
-    def fade_character_color(self, index):
-        """移除指定位置字符的打字特效tag。"""
-        try:
-            self.text_area.tag_remove("typing_effect", index, f"{index}+1c")
-        except tk.TclError:
-            pass  # 如果索引在此期间失效（例如文本被删除），就忽略
-
     def init_syntax_highlighting(self):
-        """配置Pygments语法高亮所需的颜色标签。"""
+        """计算Pygments语法高亮所需的颜色标签，之后创建的编辑区据此配置，已有的编辑区在这里补上。"""
+        from pygments.styles import get_style_by_name
         self.style = get_style_by_name('one-dark')
+        self.highlight_tag_options = {}  # {tag名: tag_configure参数}
         for token, style in self.style:
             tag_name = str(token)
             kwargs = {}
             if style['color']: kwargs['foreground'] = '#' + style['color']
             if style['bold']: kwargs['font'] = ('Consolas', 12, 'bold')
-            if kwargs: self.text_area.tag_configure(tag_name, **kwargs)
+            if kwargs: self.highlight_tag_options[tag_name] = kwargs
+        editors = [(self.blank_text, self.blank_highlighter)]
+        editors += [(data['text'], data['highlighter']) for data in self.open_files.values()]
+        for text, highlighter in editors:
+            for tag_name, kwargs in self.highlight_tag_options.items():
+                text.tag_configure(tag_name, **kwargs)
+            text.tag_raise("typing_effect")  # 特效颜色要盖过后配置的高亮tag
+            highlighter.tags = frozenset(self.highlight_tag_options)
 
     def schedule_syntax_highlight(self, event=None):
         """在用户停止输入一小段时间后，触发语法高亮，以提高性能。"""
@@ -161,28 +3340,34 @@ class FunkyIDE:
         self._highlight_job = self.root.after(200, self.apply_syntax_highlighting)
 
     def apply_syntax_highlighting(self):
-        """实际执行语法高亮的核心逻辑。"""
+        """实际执行语法高亮的核心逻辑：只重新分析上次高亮之后被编辑过的行。"""
         if not self.current_file: return
+        if self.highlighter.lexer is None: return  # 找不到合适的词法分析器，不进行高亮
+        self.highlighter.highlight()
 
-        content = self.text_area.get("1.0", "end-1c")
-        if not content: return
-
-        # 先移除旧的高亮
-        for token, _ in self.style:
-            self.text_area.tag_remove(str(token), "1.0", END)
-
+    def _resolve_lexer(self, filename, content):
+        """确定文件的词法分析器。每个文件只在打开或改名时调用一次，结果缓存在 open_files 中。"""
+        from pygments.lexers import guess_lexer_for_filename
+        from pygments.util import ClassNotFound
         try:
-            lexer = guess_lexer_for_filename(self.current_file, content)
+            return guess_lexer_for_filename(filename, content)
         except ClassNotFound:
-            return  # 找不到合适的词法分析器，不进行高亮
+            return None
 
-        start_index = "1.0"
-        for ttype, tvalue in lex(content, lexer):
-            end_index = f"{start_index}+{len(tvalue)}c"
-            tag_name = str(ttype)
-            if tag_name in self.text_area.tag_names():
-                self.text_area.tag_add(tag_name, start_index, end_index)
-            start_index = end_index
+    def on_language_selected(self):
+        """“语言”菜单回调：为当前文件手动指定或恢复自动检测词法分析器。"""
+        if not self.current_file: return
+        file_data = self.open_files[self.current_file]
+        alias = self.language_var.get()
+        if alias == "auto":
+            file_data['lexer_override'] = None
+            file_data['lexer'] = self._resolve_lexer(self.current_file, self.text_area.get("1.0", "end-1c"))
+        else:
+            file_data['lexer_override'] = alias
+            from pygments.lexers import get_lexer_by_name
+            file_data['lexer'] = get_lexer_by_name(alias)
+        self.highlighter.set_lexer(file_data['lexer'])
+        self.apply_syntax_highlighting()
 
     # --- 文件与标签页管理 ---
 
@@ -194,6 +3379,9 @@ class FunkyIDE:
 
         filepath = os.path.join(self.storage_path, filename)
         try:
+            if os.path.getsize(filepath) >= LARGE_FILE_THRESHOLD:
+                self._open_large_file(filename, filepath)
+                return
             with open(filepath, 'r', encoding='utf-8') as f:
                 content = f.read()
             self._create_tab(filename, content, is_dirty=False)
@@ -201,92 +3389,151 @@ class FunkyIDE:
         except Exception as e:
             messagebox.showerror("读取失败", f"无法读取文件 '{filename}':\n{e}")
 
-    def _create_tab(self, filename, content, is_dirty):
-        """创建一个新的标签页UI组件并存入状态。"""
-        # 创建标签UI
-        tab = Frame(self.tab_container, bg="#323639", borderwidth=1, relief="raised")
-        tab_label = Label(tab, text=filename, bg="#323639", fg="white", padx=5)
-        tab_label.pack(side="left", fill="both", expand=True)
-        close_btn = Button(tab, text="×", bg="#323639", fg="white", relief="flat",
-                           command=lambda f=filename: self.close_tab(f))
-        close_btn.pack(side="right")
-
-        # 绑定事件
-        switch_cmd = lambda e, f=filename: self.switch_to_tab(f)
-        tab.bind("<Button-1>", switch_cmd)
-        tab_label.bind("<Button-1>", switch_cmd)
-
-        # 绑定核心的弹跳效果事件
-        tab.bind("<Enter>", self.on_tab_enter)
-        tab.bind("<Leave>", self.on_tab_leave)
+    def _open_large_file(self, filename, filepath):
+        """以只读的大文件模式打开：内存映射文件，只载入视口附近的行，只高亮当前窗口，不启用打字特效。"""
+        self._create_tab(filename, None, is_dirty=False)
+        self._attach_large_view(filename, filepath)
+        self.switch_to_tab(filename)
+
+    def _attach_large_view(self, filename, filepath):
+        file_data = self.open_files[filename]
+        with open(filepath, 'r', encoding='utf-8', errors='replace') as f:
+            sample = f.read(64 * 1024)  # 只用开头的一小段来猜测语言
+        file_data['lexer'] = self._resolve_lexer(filename, sample)
+        file_data['highlighter'].set_lexer(file_data['lexer'])
+        file_data['large'] = LargeFileView(file_data['text'], file_data['highlighter'], filepath)
+        file_data['text'].bind("<Control-g>", lambda e, f=filename: self.goto_line(f))
+
+    def goto_line(self, filename):
+        """大文件模式下跳转到指定行。"""
+        view = self.open_files[filename]['large']
+        line = simpledialog.askinteger("转到行", f"行号（已索引 {view.index.line_count()} 行）:",
+                                       minvalue=1, parent=self.root)
+        if line and not view.goto_line(line):
+            messagebox.showinfo("请稍候", "该行还没有被索引到，请稍后再试。", parent=self.root)
+
+    def _create_tab(self, filename, content, is_dirty, lazy=None):
+        """创建一个新的标签页并存入状态。content 为None时先不载入内容；lazy 为会话中记录的光标和滚动位置。"""
+        # 创建该标签页自己的编辑区，内容只载入这一次；标签本身由标签栏按需创建
+        text, highlighter = self._create_editor()
+        file_data = {'text': text, 'highlighter': highlighter, 'is_dirty': is_dirty,
+                     'lexer': None, 'lexer_override': None, 'large': None, 'lazy': lazy, 'highlight_key': None}
+        highlighter.on_done = lambda: self._store_highlight(file_data)
+        if content is not None:
+            self._load_content(filename, file_data, content)
 
         # 存入状态
-        self.open_files[filename] = {'content': content, 'is_dirty': is_dirty, 'tab': tab}
-        self.redraw_tabs()
+        self.open_files[filename] = file_data
+        self.tab_strip.add(filename)
+
+    def _load_content(self, filename, file_data, content):
+        """把内容载入标签页的编辑区。高亮缓存中有同样内容的分析结果时直接打tag，否则在后台完成首次高亮。"""
+        text, highlighter = file_data['text'], file_data['highlighter']
+        text.delete("1.0", END)
+        text.insert("1.0", content)
+        text.edit_reset()  # 载入内容不应进入撤销栈
+        text.edit_modified(False)
+        if file_data['lexer_override']:
+            from pygments.lexers import get_lexer_by_name
+            file_data['lexer'] = get_lexer_by_name(file_data['lexer_override'])
+        else:
+            file_data['lexer'] = self._resolve_lexer(filename, content)
+        highlighter.set_lexer(file_data['lexer'])
+        if file_data['lexer'] is None: return
+        key = HighlightCache.key(content, file_data['lexer'])
+        cached = self.highlight_cache.get(key)
+        if cached and highlighter.load(*cached): return
+        file_data['highlight_key'] = (key, highlighter.version)
+        highlighter.highlight()
 
-    def redraw_tabs(self):
-        """重新绘制所有标签页，以保持正确的顺序和布局。"""
-        for widget in self.tab_container.winfo_children():
-            widget.pack_forget()  # 使用 pack_forget() 比 destroy() 稍好，因为Frame对象仍在内存中
+    def _store_highlight(self, file_data):
+        """高亮完成的回调：内容与计算缓存键时相同，就把分析结果写入高亮缓存。"""
+        pending = file_data['highlight_key']
+        if pending is None: return
+        key, version = pending
+        highlighter = file_data['highlighter']
+        if highlighter.version == version:
+            snapshot = highlighter.snapshot()
+            if snapshot: self.highlight_cache.put(key, *snapshot)
+        file_data['highlight_key'] = None
 
-        for filename in self.open_files:
-            self.open_files[filename]['tab'].pack(side="left", fill="y", padx=(1, 0))
+    def _load_lazy_tab(self, filename):
+        """第一次显示会话中恢复的标签页时才读取文件、高亮，并恢复光标和滚动位置。读取失败时关闭该标签页。"""
+        file_data = self.open_files[filename]
+        state, file_data['lazy'] = file_data['lazy'], None
+        filepath = os.path.join(self.storage_path, filename)
+        try:
+            if os.path.getsize(filepath) >= LARGE_FILE_THRESHOLD:
+                self._attach_large_view(filename, filepath)
+            else:
+                with open(filepath, 'r', encoding='utf-8') as f:
+                    content = f.read()
+                self._load_content(filename, file_data, content)
+        except (OSError, UnicodeDecodeError) as e:
+            messagebox.showerror("读取失败", f"无法读取文件 '{filename}':\n{e}", parent=self.root)
+            self.close_tab(filename)
+            return False
+        text = file_data['text']
+        if state.get('cursor'): text.mark_set(tk.INSERT, state['cursor'])
+        if state.get('top'): text.yview(state['top'])
+        return True
 
     def switch_to_tab(self, filename):
-        """切换到指定的标签页。"""
-        # A. 保存当前标签页的内容 (如果存在)
-        if self.current_file and self.current_file in self.open_files:
-            self.open_files[self.current_file]['content'] = self.text_area.get("1.0", "end-1c")
+        """切换到指定的标签页。会话中恢复的标签页载入失败时返回False。"""
+        # A. 先完成当前标签页尚在等待的高亮任务
+        if self._highlight_job:
+            self.root.after_cancel(self._highlight_job)
+            self._highlight_job = None
+            self.apply_syntax_highlighting()
 
-        self.current_file = filename
+        # 会话中恢复的标签页在这里才载入内容，必须在换上它的编辑区之前，否则载入会被当成编辑
+        if self.open_files[filename]['lazy'] is not None and not self._load_lazy_tab(filename):
+            return False
 
-        # B. 更新所有标签页的视觉样式
-        for f, data in self.open_files.items():
-            is_active = (f == filename)
-            active_bg = "#5f6368"
-            inactive_bg = "#323639"
-            bg = active_bg if is_active else inactive_bg
+        self.current_file = filename
 
-            tab, label, btn = data['tab'], data['tab'].winfo_children()[0], data['tab'].winfo_children()[1]
-            tab.config(bg=bg)
-            label.config(bg=bg)
-            btn.config(bg=bg)
+        # B. 只重新设置新旧两个标签的样式，必要时把新标签滚动到可见区域
+        self.tab_strip.set_active(filename)
 
-        # C. 加载新标签页的内容到编辑器
+        # C. 换上新标签页自己的编辑区，其中的tag、撤销栈、光标和滚动位置都原样保留
         file_data = self.open_files[filename]
-        self.text_area.delete("1.0", END)
-        self.text_area.insert("1.0", file_data['content'])
-        self.text_area.edit_modified(False)  # 重置修改标记
+        self._show_editor(file_data['text'])
+        self.highlighter = file_data['highlighter']
+        self.language_var.set(file_data['lexer_override'] or "auto")
 
         # D. 更新UI状态
         self.update_title()
         self.save_button.config(state="normal" if file_data['is_dirty'] else "disabled")
-        self.apply_syntax_highlighting()
+        self.text_area.focus_set()
+        self.schedule_live_preview()
+        self.refresh_outline()
 
     def close_tab(self, filename):
         """关闭一个标签页，处理未保存的更改。"""
         if self.open_files[filename]['is_dirty']:
             res = messagebox.askyesnocancel("未保存", f"文件 '{filename}' 尚未保存，要现在保存吗？", parent=self.root)
             if res is True:
-                self.switch_to_tab(filename)  # 必须先切换到这个tab才能保存
-                self.save_file()
-                if self.open_files[filename]['is_dirty']: return  # 保存失败或取消，则不关闭
+                filename = self._save(filename)  # 内容快照交给后台写入，写入失败时会重新打开该文件
+                if filename is None: return  # 取消了保存，则不关闭
             elif res is None:
                 return  # 用户点了取消
 
         # 执行关闭
-        self.open_files[filename]['tab'].destroy()
-        del self.open_files[filename]
+        file_data = self.open_files.pop(filename)
+        if file_data['text'] is self.text_area:
+            self._show_editor(self.blank_text)
+        self.tab_strip.remove(filename)
+        if file_data['large']: file_data['large'].close()
+        file_data['highlighter'].close()
+        file_data['text'].destroy()
 
         if not self.open_files:
             self.reset_editor_state()
         elif self.current_file == filename:
             # 自动切换到剩下的第一个标签页
-            next_file = list(self.open_files.keys())[0]
+            next_file = next(iter(self.open_files))
             self.switch_to_tab(next_file)
 
-        self.redraw_tabs()
-
     def new_file(self):
         """创建一个新的未命名文件标签页。"""
         i = 1
@@ -303,60 +3550,76 @@ class FunkyIDE:
     def save_file(self):
         """保存当前活动的文件。"""
         if not self.current_file: return
+        self._save(self.current_file)
 
-        filename = self.current_file
+    def _save(self, name, on_done=None):
+        """把标签页内容的快照交给后台写入线程，返回保存后的文件名，未提交则返回None。写完后调用 on_done(error)。"""
+        filename = name
         # 如果是未命名文件，则弹出对话框要求输入新文件名
         if filename.startswith("Untitled-"):
+            if name != self.current_file: self.switch_to_tab(name)  # 让用户看到要命名的是哪个文件
             new_name = simpledialog.askstring("保存文件", "请输入文件名:", initialvalue=filename, parent=self.root)
-            if not new_name or not self._is_valid_filename(new_name): return
+            if not new_name or not self._is_valid_filename(new_name): return None
             filename = new_name
 
         filepath = os.path.join(self.storage_path, filename)
-        if os.path.exists(filepath) and self.current_file != filename:
-            if not messagebox.askyesno("确认覆盖", f"文件 '{filename}' 已存在，要覆盖它吗？", parent=self.root): return
-
-        try:
-            content = self.text_area.get("1.0", "end-1c")
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(content)
-
-            # 更新内部状态，特别是处理重命名的情况
-            file_data = self.open_files.pop(self.current_file)
-            file_data.update({'content': content, 'is_dirty': False})
-            self.open_files[filename] = file_data
+        if os.path.exists(filepath) and name != filename:
+            if not messagebox.askyesno("确认覆盖", f"文件 '{filename}' 已存在，要覆盖它吗？", parent=self.root): return None
 
-            if self.current_file != filename:
-                self._update_tab_filename(self.current_file, filename, file_data['tab'])
+        # 更新内部状态，特别是处理重命名的情况。写入失败时会重新标记为未保存
+        file_data = self.open_files.pop(name)
+        content = file_data['text'].get("1.0", "end-1c")
+        file_data['is_dirty'] = False
+        self.open_files[filename] = file_data
 
+        if name != filename:
+            self.tab_strip.rename(name, filename)
+            if not file_data['lexer_override']:  # 改名后扩展名可能变了，重新确定词法分析器
+                file_data['lexer'] = self._resolve_lexer(filename, content)
+                file_data['highlighter'].set_lexer(file_data['lexer'])
+        if self.current_file == name:
             self.current_file = filename
-            self.text_area.edit_modified(False)
+        file_data['text'].edit_modified(False)
+        if file_data['lexer'] and not file_data['large']:  # 保存的内容下次打开时可以直接用缓存的高亮
+            file_data['highlight_key'] = (HighlightCache.key(content, file_data['lexer']),
+                                          file_data['highlighter'].version)
+            self._store_highlight(file_data)  # 已经高亮完毕时立即写入，否则等高亮完成
 
+        self.pending_saves += 1
+        self.writer.submit(filepath, content,
+                           lambda error: self._on_save_done(filename, content, error, on_done))
+        if self.current_file == filename:
             self.save_button.config(state="disabled")
-            self.update_file_list()
-            self.update_title()
             self.apply_syntax_highlighting()
+        self.update_title()
+        return filename
 
-        except Exception as e:
-            messagebox.showerror("保存失败", f"无法保存文件:\n{e}", parent=self.root)
-
-    def _update_tab_filename(self, old_name, new_name, tab):
-        """辅助函数，在重命名后更新标签的UI和事件绑定。"""
-        tab.winfo_children()[0].config(text=new_name)
-        tab.winfo_children()[1].config(command=lambda f=new_name: self.close_tab(f))
-
-        switch_cmd = lambda e, f=new_name: self.switch_to_tab(f)
-        tab.bind("<Button-1>", switch_cmd)
-        tab.winfo_children()[0].bind("<Button-1>", switch_cmd)
+    def _on_save_done(self, filename, content, error, on_done=None):
+        """后台写入完成的回调，在界面线程中执行。"""
+        self.pending_saves -= 1
+        if error is None:
+            self.file_list.apply_changes(added=[filename])
+            self.search_index.update([filename])
+            self.symbol_index.update([filename])
+        else:
+            file_data = self.open_files.get(filename)
+            if file_data is None:  # 标签页已经关掉了，用写入时的快照重新打开，避免内容丢失
+                self._create_tab(filename, content, is_dirty=True)
+            else:
+                file_data['is_dirty'] = True
+                if filename == self.current_file:
+                    self.save_button.config(state="normal")
+            self.update_title()
+            messagebox.showerror("保存失败", f"无法保存文件 '{filename}':\n{error}", parent=self.root)
+        if on_done: on_done(error)
 
     def delete_file(self):
         """从文件列表删除选中的文件。"""
-        selected_indices = self.file_listbox.curselection()
-        if not selected_indices:
+        filename = self.file_list.selected
+        if filename is None:
             messagebox.showwarning("提示", "请先在左侧列表中选择要删除的文件。")
             return
 
-        filename = self.file_listbox.get(selected_indices[0])
-
         confirm = messagebox.askyesno("确认删除", f"确定要永久删除 '{filename}' 吗？\n此操作无法撤销！", parent=self.root)
         if confirm:
             try:
@@ -367,11 +3630,100 @@ class FunkyIDE:
                     self.close_tab(filename)
 
                 os.remove(os.path.join(self.storage_path, filename))
-                self.update_file_list()
+                self.file_list.apply_changes(removed=[filename])
+                self.search_index.remove([filename])
+                self.symbol_index.remove([filename])
 
             except Exception as e:
                 messagebox.showerror("删除失败", f"无法删除文件 '{filename}':\n{e}", parent=self.root)
 
+    # --- 全文搜索 ---
+
+    def show_find_in_files(self):
+        """打开（或切换到已打开的）“在文件中查找”窗口。"""
+        if self.find_window is not None and self.find_window.winfo_exists():
+            self.find_window.lift()
+            return
+        self.find_window = FindInFilesWindow(self.root, self.search_index, self.open_match)
+
+    def open_match(self, filename, line, col, end_line, end_col):
+        """打开搜索结果所在的文件并选中匹配的文本。"""
+        self.open_file(filename)
+        if self.current_file != filename: return  # 打开失败
+        file_data = self.open_files[filename]
+        offset = 0
+        if file_data['large']:  # 大文件只载入了一个窗口，行号要换算到窗口内
+            if not file_data['large'].goto_line(line): return
+            offset = file_data['large'].start
+        text = file_data['text']
+        start, end = f"{line - offset}.{col}", f"{end_line - offset}.{end_col}"
+        text.tag_remove("sel", "1.0", END)
+        text.tag_add("sel", start, end)
+        text.mark_set(tk.INSERT, start)
+        text.see(start)
+        text.focus_set()
+
+    def resync_indexes(self):
+        """重新对比工作目录，更新在IDE之外修改过的文件的索引。"""
+        self.search_index.sync()
+        self.symbol_index.sync()
+
+    # --- 符号与大纲 ---
+
+    def _on_symbols_updated(self, names):
+        """符号索引的回调（后台线程）：当前文件的符号变了就刷新大纲。"""
+        try:
+            self.root.after(0, self.refresh_outline, names)
+        except (RuntimeError, tk.TclError):
+            pass  # 窗口已经关闭
+
+    def refresh_outline(self, names=None):
+        """按索引中的符号重建当前文件的大纲；names 不包含当前文件时什么也不做。"""
+        if names is not None and self.current_file not in names: return
+        symbols = self.symbol_index.outline(self.current_file) if self.current_file else []
+        self.outline_symbols = [s for s in symbols if s[1] != 'import']
+        self.outline_list.delete(0, END)
+        lines = [f"{'    ' * (s[4].count('.') + 1 if s[4] else 0)}{SYMBOL_KIND_LABELS[s[1]]} {s[0]}"
+                 for s in self.outline_symbols]
+        if lines:
+            self.outline_list.insert(END, *lines)
+
+    def on_outline_select(self, event=None):
+        selection = self.outline_list.curselection()
+        if selection and self.current_file:
+            self.open_symbol(self.current_file, self.outline_symbols[selection[0]])
+
+    def open_symbol(self, filename, symbol):
+        """打开符号所在的文件并选中符号名（导入语句只定位到行首）。"""
+        name, kind, line, col = symbol[:4]
+        self.open_match(filename, line, col, line, col if kind == 'import' else col + len(name))
+
+    def show_symbol_search(self, query=""):
+        """打开（或切换到已打开的）“转到符号”窗口。"""
+        if self.symbol_window is not None and self.symbol_window.winfo_exists():
+            if query: self.symbol_window.set_query(query)
+            self.symbol_window.lift()
+            return
+        self.symbol_window = SymbolSearchWindow(self.root, self.symbol_index, self.open_symbol, query)
+
+    def go_to_definition(self, index=tk.INSERT):
+        """跳到 index 处名称的定义：只有一处（或当前文件中只有一处）时直接跳转，否则列出所有定义。"""
+        name = self.text_area.get(f"{index} wordstart", f"{index} wordend").strip()
+        if not name.isidentifier(): return "break"
+        definitions = self.symbol_index.lookup(name)
+        # 导入只是别名，有真正的定义时优先跳到定义
+        definitions = [d for d in definitions if d[1][1] != 'import'] or definitions
+        local = [d for d in definitions if d[0] == self.current_file]
+        if len(local) == 1:
+            definitions = local
+        if not definitions:
+            messagebox.showinfo("转到定义", f"没有找到 '{name}' 的定义。", parent=self.root)
+        elif len(definitions) == 1:
+            self.open_symbol(*definitions[0])
+        else:
+            self.show_symbol_search(name)
+        return "break"
+
     # --- 运行与预览 ---
 
     def run_or_preview(self):
@@ -379,70 +3731,257 @@ class FunkyIDE:
         if not self.current_file:
             messagebox.showwarning("无文件", "没有正在编辑的文件。")
             return
-        if self.open_files[self.current_file]['is_dirty']:
-            messagebox.showwarning("请先保存", "文件有未保存的更改，请先保存后再操作。")
-            return
-
         _, extension = os.path.splitext(self.current_file.lower())
         if extension == '.py':
+            if self.open_files[self.current_file]['is_dirty']:
+                messagebox.showwarning("请先保存", "文件有未保存的更改，请先保存后再操作。")
+                return
             self.run_python_script()
         elif extension in ['.md', '.markdown']:
-            self.preview_markdown()
+            self.preview_markdown()  # 预览直接使用编辑区中的内容，不需要先保存
         else:
             messagebox.showinfo("不支持", f"还不支持直接运行或预览 '{extension}' 类型的文件。")
 
-    # ... [run_python_script, read_pipe, update_output_text, preview_markdown 这几个函数无需修改，可直接复制]
     def run_python_script(self):
         script_path = os.path.join(self.storage_path, self.current_file)
-        # ... (此函数无需修改)
-        output_window = Toplevel(self.root);
-        output_window.title(f"运行输出 - {self.current_file}");
-        output_window.geometry("600x400");
+        output_window = Toplevel(self.root)
+        output_window.title(f"运行输出 - {self.current_file}")
+        output_window.geometry("600x400")
         output_window.transient(self.root)
-        output_text = Text(output_window, wrap="word", font=("Consolas", 10), bg="black", fg="lightgreen");
+        toolbar = Frame(output_window)
+        toolbar.pack(fill="x")
+        output_text = Text(output_window, wrap="word", font=("Consolas", 10), bg="black", fg="lightgreen")
         output_text.pack(fill="both", expand=True)
-        output_text.insert(END, f"--- 正在运行: {script_path} ---\n\n");
+        output_text.tag_config('lightgreen', foreground='lightgreen')
+        output_text.tag_config('red', foreground='red')
+        output_text.insert(END, f"--- 正在运行: {script_path} ---\n\n")
         output_text.config(state="disabled")
 
-        def process_runner():
+        pump = OutputPump(self.root, lambda chunks: self.update_output_text(output_text, chunks))
+
+        # 可选：把不受行数上限影响的完整输出另存为日志文件
+        log_var = tk.BooleanVar(value=OUTPUT_SPILL_TO_FILE)
+        log_name = f"{os.path.splitext(self.current_file)[0]}-{time.strftime('%Y%m%d-%H%M%S')}.log"
+        log_path = os.path.join(self.storage_path, OUTPUT_LOG_DIR_NAME, log_name)
+
+        def toggle_log():
+            if not log_var.get():
+                pump.close_log()
+                return
             try:
-                process = subprocess.Popen([sys.executable, script_path], stdout=subprocess.PIPE,
-                                           stderr=subprocess.PIPE, text=True, encoding='utf-8',
-                                           creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0)
-                threading.Thread(target=self.read_pipe, args=(process.stdout, 'lightgreen', output_text),
-                                 daemon=True).start()
-                threading.Thread(target=self.read_pipe, args=(process.stderr, 'red', output_text), daemon=True).start()
-            except Exception as e:
-                self.root.after(0, self.update_output_text, output_text, f"\n--- 启动失败 ---\n{e}", 'red')
+                pump.open_log(log_path)
+                pump.write('lightgreen', f"\n--- 完整日志写入: {log_path} ---\n")
+            except OSError as e:
+                log_var.set(False)
+                messagebox.showerror("日志", f"无法创建日志文件:\n{e}", parent=output_window)
+
+        tk.Checkbutton(toolbar, text="完整日志写入文件", variable=log_var, command=toggle_log).pack(side="left")
+        if log_var.get():
+            toggle_log()
+
+        warm_pool = self.warm_pool
+
+        def launcher():
+            if warm_pool:
+                return warm_pool.run(script_path)
+            import subprocess
+            return subprocess.Popen([sys.executable, '-u', script_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                    creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0)
+
+        run = ScriptRun(script_path, pump, launcher)
+        Button(toolbar, text="✕ 强制结束", command=lambda: self.run_manager.stop(run, kill=True)).pack(side="right")
+        Button(toolbar, text="■ 停止", command=lambda: self.run_manager.stop(run)).pack(side="right", padx=5)
+
+        def on_destroy(event):
+            # 关掉输出窗口就没有地方看输出、也没有停止按钮了：取消排队中的运行，结束运行中的进程，让出并发名额
+            if event.widget is not output_window: return
+            pump.close()
+            self.run_manager.stop(run)
 
-        threading.Thread(target=process_runner, daemon=True).start()
+        output_window.bind("<Destroy>", on_destroy)
+        self.run_manager.submit(run)
 
-    def read_pipe(self, pipe, color, text_widget):
+    def on_fast_run_toggled(self):
+        """开启“快速运行”时在后台预热解释器进程，关闭时结束空闲的预热进程。"""
+        if self.fast_run_var.get():
+            if not self.warm_pool:
+                self.warm_pool = WarmWorkerPool()
+                self.warm_pool.refill()
+        elif self.warm_pool:
+            self.warm_pool.shutdown()
+            self.warm_pool = None
+
+    def read_pipe(self, pipe, tag, pump):
+        """读取线程：有多少读多少，按原始数据块写入缓冲泵，而不是每行投递一次UI事件。"""
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
         try:
-            for line in iter(pipe.readline, ''): self.root.after(0, self.update_output_text, text_widget, line, color)
+            while True:
+                data = os.read(pipe.fileno(), 65536)
+                text = decoder.decode(data, final=not data).replace('\r\n', '\n')
+                if text:
+                    pump.write(tag, text)
+                if not data:
+                    break
         finally:
             pipe.close()
 
-    def update_output_text(self, text_widget, line, color):
-        text_widget.config(state="normal");
-        text_widget.tag_config(color, foreground=color);
-        text_widget.insert(END, line, color);
-        text_widget.see(END);
+    def update_output_text(self, text_widget, chunks):
+        """把一帧内缓冲的全部输出用一次 insert 写入输出窗口，并把总行数限制在 OUTPUT_SCROLLBACK_LINES 以内。"""
+        # 合并相邻的同一输出流数据块
+        merged = []
+        for tag, data in chunks:
+            if merged and merged[-1][0] == tag:
+                merged[-1][1].append(data)
+            else:
+                merged.append((tag, [data]))
+        pieces = [[tag, ''.join(parts)] for tag, parts in merged]
+
+        # 这一帧的输出本身就超过上限时，只插入最后 OUTPUT_SCROLLBACK_LINES 行，其余反正会被裁掉
+        excess = sum(data.count('\n') for _, data in pieces) - OUTPUT_SCROLLBACK_LINES
+        while excess > 0:
+            count = pieces[0][1].count('\n')
+            if count <= excess:
+                pieces.pop(0)
+                excess -= count
+            else:
+                cut = -1
+                for _ in range(excess):
+                    cut = pieces[0][1].index('\n', cut + 1)
+                pieces[0][1] = pieces[0][1][cut + 1:]
+                break
+
+        args = []
+        for tag, data in pieces:
+            args += (data, tag)
+        text_widget.config(state="normal")
+        text_widget.insert(END, *args)
+        # 最后一个换行符之后还有一个空行，不计入上限
+        excess = int(text_widget.index("end-1c").split('.')[0]) - 1 - OUTPUT_SCROLLBACK_LINES
+        if excess > 0:
+            text_widget.delete("1.0", f"{excess + 1}.0")
+        text_widget.see(END)
         text_widget.config(state="disabled")
 
     def preview_markdown(self):
-        filepath = os.path.join(self.storage_path, self.current_file)
+        """打开实时预览：服务器和浏览器页面只在第一次预览时启动，之后只推送内容更新。"""
+        if not self.live_preview_var.get():
+            self.live_preview_var.set(True)
+            self.on_live_preview_toggled()
+        else:
+            self.update_live_preview()
+
+    def on_live_preview_toggled(self):
+        """“实时预览”菜单回调：开启时启动本机服务器并打开一次浏览器，关闭时停止服务器。"""
+        if self.live_preview_var.get():
+            try:
+                self.live_preview = LivePreviewServer()
+            except OSError as e:
+                self.live_preview_var.set(False)
+                messagebox.showerror("预览失败", f"无法启动实时预览服务器:\n{e}")
+                return
+            self.update_live_preview()
+            self.open_live_preview_page()
+        elif self.live_preview:
+            self.live_preview.close()
+            self.live_preview = None
+
+    def open_live_preview_page(self):
+        """在浏览器中打开预览页面，用于页面被关掉之后重新打开。"""
+        if self.live_preview is None:
+            self.live_preview_var.set(True)
+            self.on_live_preview_toggled()
+            return
+        import webbrowser
+        webbrowser.open(self.live_preview.url)
+
+    def _is_markdown(self, filename):
+        return os.path.splitext(filename.lower())[1] in ('.md', '.markdown')
+
+    def schedule_live_preview(self, event=None):
+        """编辑Markdown时，在停止输入一小段时间后推送预览更新。"""
+        if self.live_preview is None: return
+        if self._live_preview_job:
+            self.root.after_cancel(self._live_preview_job)
+        self._live_preview_job = self.root.after(LIVE_PREVIEW_DELAY_MS, self.update_live_preview)
+
+    def update_live_preview(self):
+        """渲染当前Markdown标签页中尚未保存的内容，只有改动过的块会重新转换。"""
+        self._live_preview_job = None
+        if self.live_preview is None or not self.current_file: return
+        if not self._is_markdown(self.current_file): return  # 切换到其他文件时，预览页面保留上一个Markdown文档
+        if self.md_renderer is None:
+            self.md_renderer = MarkdownBlockRenderer()
+        blocks = self.md_renderer.render(self.text_area.get("1.0", "end-1c"))
+        self.live_preview.publish(self.current_file, blocks)
+
+    def export_markdown(self):
+        """在后台把工作目录中所有Markdown导出为HTML，完成后报告结果。"""
+        if self._export_running: return
+        self._export_running = True
+
+        def worker():
+            try:
+                result = export_markdown_tree(self.storage_path, EXPORT_PATH)
+            except Exception as e:
+                result = e
+            self.root.after(0, self._on_export_done, result)
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _on_export_done(self, result):
+        self._export_running = False
+        if isinstance(result, Exception):
+            messagebox.showerror("导出失败", f"无法导出Markdown:\n{result}")
+            return
+        msg = (f"导出 {len(result['exported'])} 个，未变化跳过 {result['skipped']} 个，"
+               f"清理 {len(result['removed'])} 个。\n输出目录: {EXPORT_PATH}")
+        if result['errors']:
+            details = "\n".join(f"{name}: {err}" for name, err in result['errors'].items())
+            messagebox.showwarning("导出完成（有错误）", msg + "\n\n以下文件导出失败:\n" + details)
+        else:
+            messagebox.showinfo("导出完成", msg)
+
+    # --- 性能监视 ---
+
+    def on_perf_toggled(self):
+        """“性能监视浮窗”菜单回调：开启监视并在窗口右下角显示统计，关闭时停止监视。"""
+        if self.perf_var.get():
+            perf_monitor.start()
+            if self._perf_hud is None:
+                self._perf_hud = Label(self.root, justify="left", anchor="nw", font=("Consolas", 9),
+                                       bg="#111111", fg="#00FF66", padx=6, pady=4)
+            self._perf_hud.place(relx=1.0, rely=1.0, x=-4, y=-4, anchor="se")
+            self._refresh_perf_hud()
+        else:
+            perf_monitor.stop()
+            if self._perf_hud_job:
+                self.root.after_cancel(self._perf_hud_job)
+                self._perf_hud_job = None
+            if self._perf_hud is not None:
+                self._perf_hud.place_forget()
+
+    def _refresh_perf_hud(self):
+        self._perf_hud.config(text=perf_monitor.hud_text())
+        self._perf_hud.lift()
+        self._perf_hud_job = self.root.after(PERF_HUD_REFRESH_MS, self._refresh_perf_hud)
+
+    def export_perf(self, kind):
+        """把性能监视的数据导出为JSON统计或Chrome trace文件。"""
+        from tkinter import filedialog
+        if kind == "json":
+            path = filedialog.asksaveasfilename(parent=self.root, defaultextension=".json",
+                                                initialfile="funkyide-perf.json")
+        else:
+            path = filedialog.asksaveasfilename(parent=self.root, defaultextension=".json",
+                                                initialfile="funkyide-trace.json")
+        if not path: return
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                md_text = f.read()
-            html = markdown.markdown(md_text, extensions=['fenced_code', 'tables'])
-            preview_path = os.path.join(self.storage_path, "preview.html")
-            with open(preview_path, 'w', encoding='utf-8') as f:
-                style = """<style>body { font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Helvetica, Arial, sans-serif; line-height: 1.6; max-width: 800px; margin: 20px auto; padding: 0 15px; color: #333;} code { background-color: #f0f0f0; padding: 2px 4px; border-radius: 3px; font-family: "SFMono-Regular", Consolas, "Liberation Mono", Menlo, Courier, monospace;} pre { background-color: #f6f8fa; padding: 16px; border-radius: 5px; overflow-x: auto;} pre code { padding: 0; background-color: transparent; } table { border-collapse: collapse; } th, td { border: 1px solid #ddd; padding: 8px; }</style>"""
-                f.write(style + html)
-            webbrowser.open(f"file://{os.path.realpath(preview_path)}")
-        except Exception as e:
-            messagebox.showerror("预览失败", f"无法预览Markdown文件:\n{e}")
+            if kind == "json":
+                perf_monitor.export_json(path)
+            else:
+                perf_monitor.export_chrome_trace(path)
+        except OSError as e:
+            messagebox.showerror("导出失败", f"无法导出性能数据:\n{e}", parent=self.root)
 
     # --- 辅助与状态更新 ---
 
@@ -454,34 +3993,111 @@ class FunkyIDE:
                 messagebox.showerror("致命错误", f"无法创建工作目录 '{self.storage_path}':\n{e}")
                 self.root.destroy()
 
-    def on_file_double_click(self, event):
-        selected_indices = self.file_listbox.curselection()
-        if not selected_indices: return
-        filename = self.file_listbox.get(selected_indices[0])
-        self.open_file(filename)
-
     def on_text_modified(self, event=None):
+        if event is not None and event.widget is not self.text_area: return  # 后台标签页载入内容时触发的
+        if not self.text_area.edit_modified(): return  # 重置修改标记本身也会触发该事件，忽略
         if self.current_file and not self.open_files[self.current_file]['is_dirty']:
             self.open_files[self.current_file]['is_dirty'] = True
             self.update_title()
             self.save_button.config(state="normal")
         self.text_area.edit_modified(False)  # 必须重置，否则事件只会触发一次
 
+    def autosave_journal(self):
+        """定期把所有未保存标签页的内容写入恢复日志，由后台写入线程完成。"""
+        dirty = {f: data['text'].get("1.0", "end-1c") for f, data in self.open_files.items() if data['is_dirty']}
+        if dirty or self._journal_written:
+            self.writer.submit(self.journal_path, json.dumps({'files': dirty}, ensure_ascii=False))
+            self._journal_written = bool(dirty)
+        self.writer.submit(self.session_path, self._session_json())  # 异常退出时也能恢复标签页
+        self.root.after(AUTOSAVE_INTERVAL_MS, self.autosave_journal)
+
+    def _session_json(self):
+        """打开的标签页（从未保存过的新文件除外）、当前标签页，以及每个标签页的光标和滚动位置。"""
+        tabs = []
+        for filename, file_data in self.open_files.items():
+            if not os.path.isfile(os.path.join(self.storage_path, filename)): continue
+            if file_data['lazy'] is not None:  # 还没显示过，沿用上次记录的位置
+                state = dict(file_data['lazy'])
+            elif file_data['large']:
+                state = {}  # 大文件模式下的位置相对于载入的窗口，不记录
+            else:
+                text = file_data['text']
+                state = {'cursor': text.index(tk.INSERT), 'top': text.index("@0,0")}
+            state['name'] = filename
+            state['lexer_override'] = file_data['lexer_override']
+            tabs.append(state)
+        return json.dumps({'tabs': tabs, 'active': self.current_file}, ensure_ascii=False)
+
+    def restore_session(self):
+        """启动时恢复上次打开的标签页。只有当前标签页立即载入，其余的在第一次显示时才读取和高亮。"""
+        try:
+            with open(self.session_path, 'r', encoding='utf-8') as f:
+                session = json.load(f)
+        except (OSError, ValueError):
+            return
+        for state in session.get('tabs', []):
+            filename = state.get('name')
+            if not filename or filename in self.open_files: continue
+            if not os.path.isfile(os.path.join(self.storage_path, filename)): continue
+            self._create_tab(filename, None, is_dirty=False, lazy=state)
+            self.open_files[filename]['lexer_override'] = state.get('lexer_override')
+        for filename in [session.get('active')] + list(self.open_files):
+            if filename in self.open_files and self.switch_to_tab(filename) is not False:
+                break
+
+    def restore_journal(self):
+        """启动时检查恢复日志：上次异常退出时还有未保存的内容，则询问是否恢复到标签页中。"""
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                files = json.load(f).get('files', {})
+        except (OSError, ValueError):
+            return
+        if not files: return
+        msg = "上次退出时以下文件有未保存的内容:\n\n" + "\n".join(files) + "\n\n要恢复它们吗？"
+        if not messagebox.askyesno("恢复未保存的内容", msg, parent=self.root):
+            self._remove_journal()
+            return
+        for filename, content in files.items():
+            file_data = self.open_files.get(filename)
+            if file_data is None:
+                self._create_tab(filename, content, is_dirty=True)
+            elif not file_data['is_dirty'] and not file_data['large']:  # 会话中恢复的标签页，换成日志中的内容
+                file_data['lazy'] = None
+                file_data['is_dirty'] = True
+                self._load_content(filename, file_data, content)
+        self.switch_to_tab(next(iter(files)))
+        self._journal_written = True
+
+    def _remove_journal(self):
+        try:
+            os.remove(self.journal_path)
+        except OSError:
+            pass
+        self._journal_written = False
+
     def update_title(self):
         title = "FunkyIDE v8.0"
         if self.current_file:
-            star = "*" if self.open_files[self.current_file]['is_dirty'] else ""
+            file_data = self.open_files[self.current_file]
+            star = "*" if file_data['is_dirty'] else ""
             title += f" - {self.current_file}{star}"
+            if file_data['large']: title += "（大文件只读模式，Ctrl+G 转到行）"
         self.root.title(title)
 
     def update_file_list(self):
-        self.file_listbox.delete(0, END)
-        try:
-            files = [f for f in os.listdir(self.storage_path) if os.path.isfile(os.path.join(self.storage_path, f))]
-            for f in sorted(files):
-                self.file_listbox.insert(END, f)
-        except Exception as e:
-            messagebox.showerror("错误", f"无法读取文件列表:\n{e}")
+        """请求后台线程完整地重新扫描工作目录；平时的增删由目录监视自动同步。"""
+        self.file_watcher.rescan()
+
+    def on_files_changed(self, added, removed, modified, reset):
+        """DirectoryWatcher 的回调（UI线程）：只把差量应用到文件列表和搜索索引上。"""
+        if reset:  # 只在监视开始时的首次扫描出现，索引在 start() 时已经各自同步过一次
+            self.file_list.set_items(added)
+        else:
+            self.file_list.apply_changes(added, removed)
+            changed = set(added) | set(modified)  # 在IDE之外改写的文件也要重新索引，否则查找会被旧的索引排除
+            for index in (self.search_index, self.symbol_index):
+                if changed: index.update(changed)
+                if removed: index.remove(removed)
 
     def _is_valid_filename(self, filename):
         if not filename.strip():
@@ -491,12 +4107,19 @@ class FunkyIDE:
 
     def reset_editor_state(self):
         """当所有标签页关闭时，重置编辑器到初始状态。"""
+        self._show_editor(self.blank_text)
+        self.highlighter = self.blank_highlighter
         self.text_area.delete("1.0", END)
         self.current_file = None
+        for file_data in self.open_files.values():
+            if file_data['large']: file_data['large'].close()
+            file_data['highlighter'].close()
+            file_data['text'].destroy()
         self.open_files.clear()
-        for widget in self.tab_container.winfo_children():
-            widget.destroy()
+        self.tab_strip.clear()
         self.save_button.config(state="disabled")
+        self.language_var.set("auto")
+        self.refresh_outline()
         self.update_title()
         self.apply_syntax_highlighting()
 
@@ -504,27 +4127,75 @@ class FunkyIDE:
         """处理关闭窗口事件，检查所有未保存的文件。"""
         dirty_files = [f for f, data in self.open_files.items() if data['is_dirty']]
         if not dirty_files:
-            self.root.destroy()
+            self._quit()
             return
 
         msg = "以下文件有未保存的更改:\n\n" + "\n".join(dirty_files) + "\n\n是否在退出前全部保存？"
         res = messagebox.askyesnocancel("退出确认", msg, parent=self.root)
 
-        if res is True:  # 保存所有
+        if res is True:  # 保存所有：一次性提交给后台并行写入，全部写成功后再退出
+            batch = {'expected': None, 'errors': []}
+
+            def done(error):
+                batch['errors'].append(error)
+                if len(batch['errors']) == batch['expected'] and not any(batch['errors']):
+                    self._quit()
+
+            submitted = 0
             for f in dirty_files:
-                self.switch_to_tab(f)
-                self.save_file()
-            # 再次检查是否都保存成功了
-            if not any(data['is_dirty'] for data in self.open_files.values()):
-                self.root.destroy()
+                if not self._save(f, on_done=done): return  # 取消了某个文件的命名，放弃退出
+                submitted += 1
+            batch['expected'] = submitted
+            if len(batch['errors']) == submitted and not any(batch['errors']):
+                self._quit()
         elif res is False:  # 不保存并退出
-            self.root.destroy()
+            self._quit()
         # else: res is None (取消), do nothing
 
+    def _quit(self):
+        """等待已提交的保存全部写完后退出，正常退出时删除恢复日志。
+
+        自动保存提交的恢复日志也要等它写完，否则它可能在删除之后才落盘，下次启动时又提示恢复。
+        检查和删除都在界面线程中进行，两者之间不会再有新的写入提交。
+        """
+        if self.pending_saves or not self.writer.idle():
+            self.root.after(20, self._quit)
+            return
+        self._remove_journal()
+        try:
+            _atomic_write(self.session_path, self._session_json().encode('utf-8'))
+        except OSError:
+            pass
+        self.search_index.close()
+        self.symbol_index.close()
+        self.root.destroy()
+
+
+def parse_args(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="FunkyIDE - 一个专注于炫酷但“无用”功能的Python简易IDE")
+    parser.add_argument("--export-html", metavar="DIR", nargs="?", const=EXPORT_PATH,
+                        help=f"不启动界面，把Markdown批量导出为HTML（默认输出到 {EXPORT_PATH}）")
+    parser.add_argument("--source", default=STORAGE_PATH, help="导出时的Markdown源目录")
+    parser.add_argument("--jobs", type=int, default=None, help="导出时的并行进程数，默认为CPU核数")
+    parser.add_argument("--profile-startup", action="store_true", help="在终端打印启动各阶段的耗时")
+    return parser.parse_args(argv)
+
 
 if __name__ == "__main__":
+    startup_profiler.enabled = "--profile-startup" in sys.argv
+    startup_profiler.mark("导入模块")
+    args = parse_args()
+    if args.export_html:
+        result = export_markdown_tree(args.source, args.export_html, workers=args.jobs)
+        print(f"导出 {len(result['exported'])} 个，跳过 {result['skipped']} 个，清理 {len(result['removed'])} 个")
+        for name, error in result['errors'].items():
+            print(f"导出失败 {name}: {error}", file=sys.stderr)
+        sys.exit(1 if result['errors'] else 0)
     root = tk.Tk()
+    startup_profiler.mark("创建Tk根窗口")
     app = FunkyIDE(root)
+    startup_profiler.mark("构建界面")
     root.mainloop()
 
 
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+#
+#  增量语法高亮的回归测试：逐字符输入后，增量分析的结果必须与整篇重新分析完全一致
+#
+#  不需要显示器：用一个只实现了 IncrementalHighlighter 所需命令的假 Text 组件驱动真实的高亮逻辑。
+#  用法:
+#      python -m pytest tests
+
+import os
+import sys
+import time
+from collections import deque
+
+import pytest
+from pygments.lexers import JavascriptLexer, MarkdownLexer, PythonLexer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+WAIT_TIMEOUT = 10  # 等待一次高亮完成的最长时间（秒）
+
+
+class FakeTk:
+    """只处理 IncrementalHighlighter 用到的Tcl命令：改名、定义过程、index 和 get。"""
+
+    def __init__(self, widget):
+        self.widget = widget
+
+    def call(self, *args):
+        if args[0] in ('rename', 'proc'):
+            return ''
+        _, op, *indices = args
+        if op == 'index':
+            return self.widget.index(indices[0])
+        if op == 'get':
+            return self.widget.content[self.widget.offset(indices[0]):self.widget.offset(indices[1])]
+        raise ValueError(args)
+
+    def createcommand(self, name, func):
+        pass
+
+    def deletecommand(self, name):
+        pass
+
+
+class FakeText:
+    """缓冲区总以换行符结尾的最小Text组件；insert/delete 像改写后的Tcl命令一样通知高亮器。"""
+
+    _w = '.text'
+
+    def __init__(self):
+        self.content = '\n'
+        self.tk = FakeTk(self)
+        self.idle = deque()
+        self.highlighter = None
+
+    def offset(self, index):
+        base, _, modifier = index.partition(' ')
+        if base.startswith('end'):
+            pos = len(self.content) - 1
+        else:
+            line, column = (int(part) for part in base.split('.'))
+            lines = self.content.split('\n')
+            line = min(line, len(lines) - 1)
+            pos = sum(len(text) + 1 for text in lines[:line - 1]) + min(column, len(lines[line - 1]))
+        if modifier == 'lineend':
+            pos = self.content.index('\n', pos)
+        return min(pos, len(self.content) - 1)
+
+    def index(self, index):
+        pos = self.offset(index)
+        return f"{self.content.count(chr(10), 0, pos) + 1}.{pos - self.content.rfind(chr(10), 0, pos) - 1}"
+
+    def insert(self, index, chars):
+        recorded = self.highlighter._before_edit('insert', index, chars)
+        pos = self.offset(index)
+        self.content = self.content[:pos] + chars + self.content[pos:]
+        if recorded: self.highlighter._after_edit()
+
+    def after_idle(self, func, *args):
+        self.idle.append((func, args))
+
+    def tag_add(self, *args):
+        pass
+
+    def tag_remove(self, *args):
+        pass
+
+
+def highlight(highlighter):
+    """启动一次高亮，并在“UI线程”里执行后台线程投递的结果，直到全部完成。"""
+    highlighter.highlight()
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while highlighter.dirty is not None:
+        assert time.monotonic() < deadline, "高亮没有完成"
+        if highlighter.text.idle:
+            func, args = highlighter.text.idle.popleft()
+            func(*args)
+        else:
+            time.sleep(0.0005)
+
+
+def assert_typing_matches_full_lex(lexer, initial, typed):
+    widget = FakeText()
+    highlighter = widget.highlighter = main.IncrementalHighlighter(widget, ())
+    highlighter.set_lexer(lexer)
+    widget.insert('1.0', initial)
+    highlight(highlighter)
+    for count, char in enumerate(typed, 1):
+        widget.insert('end', char)
+        highlight(highlighter)
+        full = [runs for runs, _, _ in main.lex_lines(lexer, widget.content[:-1])]
+        assert highlighter.runs == full, f"输入 {typed[:count]!r} 之后增量结果与整篇分析不一致"
+
+
+@pytest.mark.parametrize('typed', [
+    "```\ncode *not emphasis*\n_still code_\n```\nafter *em*\n",
+    "```python\nx = '*a*'\n```\n*em*\n",
+    "Title\n=====\nbody\n",
+])
+def test_markdown_blocks_typed_line_by_line(typed):
+    assert_typing_matches_full_lex(MarkdownLexer(), "# Notes\n\ntext\n", typed)
+
+
+def test_javascript_block_comment_closed_below():
+    assert_typing_matches_full_lex(JavascriptLexer(), "var a = 1;\n", "/* comment\nvar b = 'x';\n*/\nvar c = 2;\n")
+
+
+def test_python_docstring_closed_below():
+    assert_typing_matches_full_lex(PythonLexer(), "x = 1\n", 'def f():\n    """doc\n    x = 1\n    """\n    return 2\n')